@@ -3,9 +3,11 @@
 Безопасное управление пользователями и системой
 """
 
-from flask import Blueprint, render_template, jsonify, request, redirect, url_for, session
+from flask import Blueprint, render_template, jsonify, request, redirect, url_for, session, Response
 from datetime import datetime, timedelta
 from functools import wraps
+import hmac
+import os
 
 
 
@@ -24,6 +26,7 @@ from forum.models import ForumStory
 from security.web_protection import csrf_protection, xss_protection, input_validator, SecurityHeaders
 from security.auth_security import rate_limiter, brute_force_protection, session_security, session_security_check, rate_limit
 from security.intrusion_prevention import security_middleware, threat_detector, get_security_stats, force_block_ip, unblock_ip
+from security.stage_metrics import stage_metrics
 
 # Константа для пароля администратора
 ADMIN_PASSWORD = "16795"
@@ -492,3 +495,23 @@ def delete_story_api():
         
     except Exception as e:
         return jsonify({'error': f'Ошибка при удалении истории: {str(e)}'}), 500
+
+@admin_bp.route('/metrics', methods=['GET'])
+def security_metrics():
+    """Гистограммы стадий безопасности в формате Prometheus (админ или токен SECURITY_METRICS_TOKEN)"""
+    # Сборщик метрик не проходит вход в админку - для него токен в заголовке Authorization
+    token = os.getenv('SECURITY_METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    token_valid = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    
+    if not token_valid and not session.get('admin_authenticated', False):
+        return Response('Требуется аутентификация администратора\n', status=403, mimetype='text/plain')
+    
+    return Response(stage_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@admin_bp.route('/security/escalation', methods=['GET'])
+@admin_required
+def security_escalation():
+    """Состояние эскалации блокировок: нарушители, сроки и tarpit"""
+    limit = request.args.get('limit', 1000, type=int)
+    return jsonify(threat_detector.escalation.export_state(limit=max(1, min(limit, 10000))))
@@ -5,6 +5,10 @@ from .chat_manager import chat_manager
 from .utils import SecurityUtils, ResponseFormatter
 import time
 import uuid
+from security.web_protection import blueprint_input_policy
+
+# Поля всех запросов чата санитизируются так же, как в SecurityUtils.sanitize_input
+blueprint_input_policy(ai_bp.name, SecurityUtils.INPUT_POLICY)
 
 def get_user_id():
     """Генерирует ID пользователя на основе сессии"""
@@ -1,20 +1,16 @@
-import re
-import html
 from typing import Dict, Any
 
+from security.web_protection import sanitized_input
+
 class SecurityUtils:
+    # Та же политика назначена полям ai_bp (см. routes.py), поэтому middleware кэширует их под ней же
+    INPUT_POLICY = 'text'
+    
     @staticmethod
     def sanitize_input(text: str) -> str:
-        """Очистка пользовательского ввода"""
-        if not text:
-            return ""
-        
-        # Удаление потенциально опасных конструкций
-        text = html.escape(text)
-        text = re.sub(r'<script.*?>.*?</script>', '', text, flags=re.IGNORECASE)
-        text = re.sub(r'on\w+=\s*".*?"', '', text)
-        
-        return text.strip()
+        """Очистка пользовательского ввода (из кэша запроса, если поле уже проверено middleware)"""
+        # После html.escape в тексте нет ни '<', ни '"': отдельные regex для <script> и on*= не нужны
+        return sanitized_input(text, SecurityUtils.INPUT_POLICY)
     
     @staticmethod
     def detect_question_complexity(question: str) -> str:
@@ -11,8 +11,12 @@ import shutil
 # 🛡️ ИМПОРТ МОДУЛЕЙ БЕЗОПАСНОСТИ
 from security.intrusion_prevention import security_middleware, threat_detector, get_security_stats, force_block_ip, unblock_ip
 from security.web_protection import security_validation_middleware, csrf_protection, xss_protection, input_validator, SecurityHeaders
-from security.auth_security import rate_limiter, two_factor_auth, brute_force_protection, session_security, initialize_auth_security, rate_limit, brute_force_protect, session_security_check
-from security.data_protection import data_encryption, password_manager, file_protection
+from security.auth_security import rate_limiter, two_factor_auth, brute_force_protection, session_security, initialize_auth_security, rate_limit, brute_force_protect, session_security_check, configure_rate_limit_backend, configure_two_factor_store
+from security.rate_limit_backends import create_rate_limit_backend
+from security.two_factor_store import TwoFactorStore
+from security.escalation import TarpitMiddleware
+from security.data_protection import data_encryption, password_manager, file_protection, DataEncryption
+from security.event_log import security_events
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -38,6 +42,27 @@ def create_app():
     app.config['SESSION_COOKIE_HTTPONLY'] = True  # Защита от XSS
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Защита от CSRF
     
+    # 🚦 ХРАНИЛИЩЕ ЛИМИТОВ: 'memory' - у каждого воркера свое, 'sqlite' - общее для всех воркеров хоста
+    app.config['RATE_LIMIT_BACKEND'] = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    app.config['RATE_LIMIT_DB_PATH'] = os.getenv('RATE_LIMIT_DB_PATH', 'instance/ratelimits.db')
+    
+    # 🔐 ХРАНИЛИЩЕ 2FA: общая БД для всех воркеров, секреты шифруются ключом из ENCRYPTION_MASTER_KEY
+    # (или SECRET_KEY), чтобы их можно было прочитать на любом воркере и после перезапуска
+    app.config['TWO_FACTOR_DB_PATH'] = os.getenv('TWO_FACTOR_DB_PATH', 'instance/two_factor.db')
+    
+    # 💤 ЛЕНИВЫЕ СЕССИИ: анонимные GET без сессии (без Set-Cookie), ID и отпечаток - только там, где сессия нужна
+    app.config['LAZY_SESSIONS'] = os.getenv('LAZY_SESSIONS', '1') == '1'
+    # Blueprint'ы с формами, входом, чатами ИИ, играми и прогрессом в сессии
+    app.config['SESSION_BLUEPRINTS'] = frozenset(os.getenv(
+        'SESSION_BLUEPRINTS', 'auth,auth_security,admin,ai,games,simulators,passwords,forum,donations'
+    ).split(','))
+    
+    # 🗃️ РОТАЦИЯ ЖУРНАЛА УГРОЗ: архив по дням и горизонт хранения (SECURITY_LOG_HOT_DAYS, SECURITY_LOG_RETENTION_DAYS)
+    app.config['SECURITY_LOG_RETENTION'] = os.getenv('SECURITY_LOG_RETENTION', '1') == '1'
+    
+    # 🚫 ОБНОВЛЕНИЕ БЛОКИРОВОК: как часто воркер сверяет blocked_ips с БД (секунды, 0 - только при старте)
+    app.config['SECURITY_BLOCKLIST_REFRESH_SECONDS'] = float(os.getenv('SECURITY_BLOCKLIST_REFRESH_SECONDS', 5))
+    
     # Создаем папки для базы данных и бэкапов
     os.makedirs('instance', exist_ok=True)
     os.makedirs('backups', exist_ok=True)
@@ -60,6 +85,42 @@ def create_app():
 
     # 🛡️ ИНИЦИАЛИЗАЦИЯ СИСТЕМЫ БЕЗОПАСНОСТИ
     
+    # Хранилище лимитов скорости
+    if app.config['RATE_LIMIT_BACKEND'] != 'memory':
+        rate_limit_backend = create_rate_limit_backend(
+            app.config['RATE_LIMIT_BACKEND'],
+            db_path=app.config['RATE_LIMIT_DB_PATH']
+        )
+        configure_rate_limit_backend(rate_limit_backend)
+        threat_detector.rate_limit_backend = rate_limit_backend
+    
+    # Хранилище 2FA с ключом шифрования, одинаковым во всех процессах
+    if not os.getenv('ENCRYPTION_MASTER_KEY'):
+        security_events.emit(
+            'two_factor_key_missing',
+            "❌ ENCRYPTION_MASTER_KEY не задан: секреты 2FA шифруются ключом из SECRET_KEY и соли, "
+            "которые (по умолчанию) есть в исходном коде",
+            level='error', secret_key_from_env=bool(os.getenv('SECRET_KEY')),
+            salt_from_env=bool(os.getenv('ENCRYPTION_SALT'))
+        )
+    configure_two_factor_store(TwoFactorStore(
+        app.config['TWO_FACTOR_DB_PATH'],
+        encryption=DataEncryption(
+            master_key=os.getenv('ENCRYPTION_MASTER_KEY') or app.config['SECRET_KEY'],
+            key_salt=os.getenv('ENCRYPTION_SALT') or 'cyberguardian-two-factor'
+        )
+    ))
+    
+    # Tarpit: повторные нарушители получают готовый 403 до маршрутизации Flask
+    app.wsgi_app = TarpitMiddleware(app.wsgi_app, threat_detector.escalation)
+    
+    # Фоновая ротация security_logs
+    if app.config['SECURITY_LOG_RETENTION']:
+        threat_detector.retention.start()
+    
+    # Блокировки и разблокировки с других воркеров gunicorn
+    threat_detector.start_blocklist_refresh(app.config['SECURITY_BLOCKLIST_REFRESH_SECONDS'])
+    
     # Инициализация базы данных
     from database import db
     db.init_app(app)
@@ -72,16 +133,12 @@ def create_app():
     @app.before_request
     def setup_security():
         """Установка системы безопасности для каждого запроса"""
-        # Инициализация отпечатка сессии
-        if 'session_id' not in session:
-            from cryptography.fernet import Fernet
-            import secrets
-            
-            # Генерируем уникальный ID сессии
-            session['session_id'] = secrets.token_urlsafe(32)
-            
-            # Сохраняем отпечаток сессии
-            session_security.store_session_fingerprint(session['session_id'], request)
+        # Инициализация отпечатка сессии: в ленивом режиме только для форм, маршрутов с сессией
+        # и посетителей, у которых сессия уже есть
+        if ('session_id' not in session and
+                (not app.config['LAZY_SESSIONS'] or session or request.method not in ('GET', 'HEAD')
+                 or request.blueprint in app.config['SESSION_BLUEPRINTS'])):
+            session_security.ensure_session(request)
         
         # Запускаем проверку угроз
         security_middleware()
@@ -267,17 +324,18 @@ def create_app():
     @rate_limit('api')
     def get_security_api_stats():
         """Детальная статистика безопасности"""
+        security_stats = get_security_stats()
         return jsonify({
-            'security_stats': get_security_stats(),
+            'security_stats': security_stats,
             'rate_limits': rate_limiter.get_rate_limit_info(request.headers.get('X-Forwarded-For', request.remote_addr)),
             'brute_force': brute_force_protection.get_attempts_info(request.headers.get('X-Forwarded-For', request.remote_addr)),
-            'threats_detected': threat_detector.get_threat_statistics()
+            'threats_detected': security_stats
         })
     
     @app.route('/api/security/block-ip', methods=['POST'])
     @rate_limit('api')
     def block_ip_api():
-        """Принудительная блокировка IP"""
+        """Принудительная блокировка IP или подсети (CIDR)"""
         ip = request.json.get('ip', '')
         reason = request.json.get('reason', 'Ручная блокировка администратором')
         hours = request.json.get('hours', 24)
@@ -286,6 +344,8 @@ def create_app():
             return jsonify({'error': 'IP адрес обязателен'}), 400
         
         result = force_block_ip(ip, reason, hours)
+        if result.get('status') == 'error':
+            return jsonify({'error': result['message']}), 400
         return jsonify(result)
     
     @app.route('/api/security/unblock-ip', methods=['POST'])
@@ -355,6 +415,9 @@ def create_app():
             # Агрессивное кэширование статических файлов (1 год)
             response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
             response.headers['Expires'] = 'Mon, 01 Jan 2030 00:00:00 GMT'
+        elif session.modified or session.get('session_id'):
+            # Ответ с данными сессии не должен попадать в общие кэши
+            response.headers['Cache-Control'] = 'private, no-cache'
         elif response.content_type and 'text/html' in response.content_type:
             # Кэширование HTML на 5 минут
             response.headers['Cache-Control'] = 'public, max-age=300'
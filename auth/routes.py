@@ -5,6 +5,7 @@ import re
 
 # Абсолютные импорты
 from auth.models import db, User
+from security.web_protection import input_policy
 
 auth_bp = Blueprint('auth', __name__)
 login_manager = LoginManager()
@@ -46,6 +47,7 @@ def get_password_strength(password):
     return strength, feedback
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@input_policy(password='skip', confirm_password='skip')
 def register():
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
@@ -127,6 +129,7 @@ def register():
     return render_template('auth/register.html')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@input_policy(password='skip')
 def login():
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
@@ -195,6 +198,7 @@ def check_email():
         return jsonify({'valid': True, 'message': 'Email доступен'})
 
 @auth_bp.route('/check_password', methods=['POST'])
+@input_policy(password='skip')
 def check_password():
     """AJAX проверка сложности пароля"""
     password = request.form.get('password', '')
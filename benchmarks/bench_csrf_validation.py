@@ -0,0 +1,136 @@
+"""
+🛡️ МИКРОБЕНЧМАРК ПРОВЕРКИ CSRF ТОКЕНОВ
+Прежняя схема (токен и время выдачи в сессии) против подписанных HMAC токенов:
+время выдачи и проверки, изменяется ли сессия
+
+Запуск: python benchmarks/bench_csrf_validation.py [--iterations 20000] [--output bench_csrf_validation.json]
+
+Модули безопасности импортируются во временном каталоге: instance/ репозитория не меняется.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import secrets
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class LegacyCSRFProtection:
+    """CSRFProtection до перехода на HMAC: токен и время его выдачи хранятся в сессии"""
+
+    def __init__(self, session):
+        self.session = session
+        self.secret_key = "cyberguardian-csrf-secret-2024"
+        self.token_timeout = 3600
+
+    def get_csrf_token(self) -> str:
+        session = self.session
+        if 'csrf_token' not in session or self.is_token_expired():
+            token_data = f"{session.get('session_id', '')}{datetime.now().timestamp()}{self.secret_key}"
+            session['csrf_token'] = hashlib.sha256(token_data.encode()).hexdigest()
+            session['csrf_token_time'] = datetime.now().isoformat()
+        return session['csrf_token']
+
+    def is_token_expired(self) -> bool:
+        try:
+            token_time = datetime.fromisoformat(self.session['csrf_token_time'])
+            return (datetime.now() - token_time).seconds > self.token_timeout
+        except (KeyError, ValueError):
+            return True
+
+    def validate_csrf_token(self, token: str) -> bool:
+        session_token = self.session.get('csrf_token')
+        return bool(session_token and token) and secrets.compare_digest(session_token, token)
+
+
+def per_call_us(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - start) / iterations * 1e6, 3)
+
+
+def run(iterations: int = 20000, output: str = None):
+    output = os.path.abspath(output or 'bench_csrf_validation.json')
+    os.chdir(tempfile.mkdtemp(prefix='cyberguardian-bench-'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from flask import Flask, session
+        from security.web_protection import CSRFProtection
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = secrets.token_hex(32)
+    results = {}
+
+    with app.test_request_context('/form', method='POST'):
+        session['session_id'] = secrets.token_urlsafe(32)
+        session.modified = False
+
+        # Прежняя схема: выдача пишет в сессию, проверка читает из нее
+        legacy = LegacyCSRFProtection(session)
+        token = legacy.get_csrf_token()
+        legacy_dirty = session.modified
+        session.modified = False
+        # Измененная сессия заново сериализуется и подписывается в Set-Cookie каждого такого ответа
+        serializer = app.session_interface.get_signing_serializer(app)
+        results['legacy'] = {
+            'issue_us': per_call_us(legacy.get_csrf_token, iterations),
+            'validate_us': per_call_us(lambda: legacy.validate_csrf_token(token), iterations),
+            'session_save_us': per_call_us(lambda: serializer.dumps(dict(session)), iterations),
+            'issue_dirties_session': legacy_dirty,
+        }
+
+        # HMAC: выдача и проверка без записи в сессию (ID сессии уже есть)
+        csrf = CSRFProtection()
+        token = csrf.generate_csrf_token()
+        scoped = csrf.generate_csrf_token('admin.delete_story_api')
+        assert csrf.validate_csrf_token(token) and csrf.validate_csrf_token(scoped, 'admin.delete_story_api')
+        assert not csrf.validate_csrf_token(scoped) and not csrf.validate_csrf_token(token + 'x')
+        session.modified = False
+        csrf.get_csrf_token()
+        hmac_dirty = session.modified
+        csrf.validate_csrf_token(token)
+        results['hmac'] = {
+            'issue_us': per_call_us(csrf.generate_csrf_token, iterations),
+            'validate_us': per_call_us(lambda: csrf.validate_csrf_token(token), iterations),
+            'validate_scoped_us': per_call_us(lambda: csrf.validate_csrf_token(scoped, 'admin.delete_story_api'),
+                                              iterations),
+            'validate_invalid_us': per_call_us(lambda: csrf.validate_csrf_token(token[:-1] + 'A'), iterations),
+            'issue_dirties_session': hmac_dirty,
+            'validate_dirties_session': session.modified,
+        }
+
+    for name, r in results.items():
+        print(f"{name:>7}: выдача {r['issue_us']:.2f} мкс  проверка {r['validate_us']:.2f} мкс  "
+              f"сессия изменена при выдаче: {r['issue_dirties_session']}")
+    print(f"⏱️ Сохранение сессии с токеном (прежняя схема, на каждый ответ с Set-Cookie): "
+          f"{results['legacy']['session_save_us']:.2f} мкс")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {output}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Микробенчмарк проверки CSRF токенов')
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    run(args.iterations, args.output)
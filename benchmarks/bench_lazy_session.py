@@ -0,0 +1,126 @@
+"""
+💤 БЕНЧМАРК ЛЕНИВЫХ СЕССИЙ
+Анонимные запросы без cookie с LAZY_SESSIONS и без: доля ответов с Set-Cookie,
+размер заголовков и ответа, процессорное время на запрос
+
+Запуск: python benchmarks/bench_lazy_session.py [--rounds 300] [--output bench_lazy_session.json]
+
+Приложение импортируется во временном каталоге: instance/ и backups/ репозитория не меняются.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Анонимный трафик: кэшируемые страницы, статика и маршруты, которым сессия нужна
+PATHS = {
+    'cached_pages': ['/', '/education/', '/health'],
+    'static': ['/static/css/main.css', '/robots.txt'],
+    'session_routes': ['/auth/login', '/games/'],
+}
+
+
+def header_bytes(response) -> int:
+    """Размер строки статуса и заголовков в HTTP/1.1"""
+    lines = [f"HTTP/1.1 {response.status}"] + [f"{name}: {value}" for name, value in response.headers.items()]
+    return len('\r\n'.join(lines).encode()) + 4
+
+
+def run_mode(app_module, lazy: bool, rounds: int, ip_prefix: int) -> dict:
+    """Прогон всех путей rounds раз; каждый запрос - новый посетитель без cookie и со своего IP"""
+    app = app_module.app
+    app.config['LAZY_SESSIONS'] = lazy
+    client = app.test_client(use_cookies=False)
+    results = {}
+    index = 0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for kind, paths in PATHS.items():
+            stats = {'requests': 0, 'set_cookie': 0, 'header_bytes': 0, 'body_bytes': 0,
+                     'cpu_seconds': 0.0, 'wall_seconds': 0.0, 'statuses': {}}
+            for _ in range(rounds):
+                for path in paths:
+                    index += 1
+                    ip = f"10.{ip_prefix}.{(index >> 8) & 255}.{index & 255}"
+                    cpu_start, wall_start = time.process_time(), time.perf_counter()
+                    response = client.get(path, headers={'X-Forwarded-For': ip})
+                    body = response.get_data()
+                    stats['cpu_seconds'] += time.process_time() - cpu_start
+                    stats['wall_seconds'] += time.perf_counter() - wall_start
+
+                    stats['requests'] += 1
+                    stats['set_cookie'] += 'Set-Cookie' in response.headers
+                    stats['header_bytes'] += header_bytes(response)
+                    stats['body_bytes'] += len(body)
+                    code = str(response.status_code)
+                    stats['statuses'][code] = stats['statuses'].get(code, 0) + 1
+
+            count = stats['requests']
+            results[kind] = {
+                'requests': count,
+                'set_cookie_share': round(stats['set_cookie'] / count, 3),
+                'avg_header_bytes': round(stats['header_bytes'] / count, 1),
+                'avg_response_bytes': round((stats['header_bytes'] + stats['body_bytes']) / count, 1),
+                'cpu_us_per_request': round(stats['cpu_seconds'] / count * 1e6, 1),
+                'wall_us_per_request': round(stats['wall_seconds'] / count * 1e6, 1),
+                'statuses': stats['statuses'],
+            }
+    return results
+
+
+def run(rounds: int = 300, output: str = None):
+    output = os.path.abspath(output or 'bench_lazy_session.json')
+    workdir = tempfile.mkdtemp(prefix='cyberguardian-bench-')
+    os.chdir(workdir)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+
+    # Прогрев шаблонов и кэшей, затем оба режима по очереди
+    run_mode(app_module, True, 5, 250)
+    modes = {
+        'eager': run_mode(app_module, False, rounds, 1),
+        'lazy': run_mode(app_module, True, rounds, 2),
+    }
+
+    gain = {}
+    for kind in PATHS:
+        eager, lazy = modes['eager'][kind], modes['lazy'][kind]
+        gain[kind] = {
+            'header_bytes_saved': round(eager['avg_header_bytes'] - lazy['avg_header_bytes'], 1),
+            'response_bytes_saved': round(eager['avg_response_bytes'] - lazy['avg_response_bytes'], 1),
+            'cpu_us_saved': round(eager['cpu_us_per_request'] - lazy['cpu_us_per_request'], 1),
+        }
+        print(f"{kind:>15}: Set-Cookie {eager['set_cookie_share']:.0%} -> {lazy['set_cookie_share']:.0%}  "
+              f"заголовки {eager['avg_header_bytes']:.0f} -> {lazy['avg_header_bytes']:.0f} байт  "
+              f"CPU {eager['cpu_us_per_request']:.0f} -> {lazy['cpu_us_per_request']:.0f} мкс")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'rounds': rounds,
+        'modes': modes,
+        'gain': gain,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {output}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарк ленивого создания сессий')
+    parser.add_argument('--rounds', type=int, default=300)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    run(args.rounds, args.output)
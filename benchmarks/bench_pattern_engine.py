@@ -0,0 +1,129 @@
+"""
+⏱️ МИКРО-БЕНЧМАРК ДВИЖКА ПАТТЕРНОВ УГРОЗ
+Сравнение старого цикла re.search с ThreatPatternEngine (с предфильтром литералов и без)
+
+Запуск: python benchmarks/bench_pattern_engine.py [итераций] [файл с телами запросов]
+Файл для воспроизведения: по одному телу на строку, либо JSON lines с полем "body"
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from security.intrusion_prevention import threat_detector
+from security.pattern_engine import ThreatPatternEngine
+from security.web_protection import XSSProtection
+
+# Реалистичная смесь: большая часть трафика чистая, часть - атаки
+CLEAN_PAYLOADS = [
+    b"",
+    b"username=demo&password=Sup3rSecret%21&remember=on",
+    b'{"question": "\xd0\x9a\xd0\xb0\xd0\xba \xd0\xb7\xd0\xb0\xd1\x89\xd0\xb8\xd1\x82\xd0\xb8\xd1\x82\xd1\x8c \xd1\x80\xd0\xbe\xd1\x83\xd1\x82\xd0\xb5\xd1\x80?"}',
+    b'{"text": "Hello world, please encrypt me", "algorithm": "fernet"}',
+    b"title=My+story&content=" + b"Lorem+ipsum+dolor+sit+amet+" * 40,
+    b'{"answers": [1, 3, 2, 4, 1, 2], "quiz_id": 7}',
+    b"email=user%40example.com&message=" + b"Thanks+for+the+course%21+" * 10,
+    b'{"password": "CorrectHorseBatteryStaple!1"}',
+]
+
+MALICIOUS_PAYLOADS = [
+    b"username=admin' OR '1'='1&password=x",
+    b"q=1 UNION SELECT username, password FROM users--",
+    b'{"text": "<script>alert(document.cookie)</script>"}',
+    b"file=../../../../etc/passwd",
+    b"host=127.0.0.1; rm -rf /tmp/x",
+    b"comment=<iframe src=javascript:alert(1)>",
+]
+
+
+def build_mix(clean_ratio: int = 9):
+    """Смесь запросов: clean_ratio чистых на одну атаку"""
+    mix = []
+    for i, payload in enumerate(MALICIOUS_PAYLOADS):
+        for j in range(clean_ratio):
+            mix.append(str(CLEAN_PAYLOADS[(i * clean_ratio + j) % len(CLEAN_PAYLOADS)]))
+        mix.append(str(payload))
+    return mix
+
+
+def load_replay(path: str):
+    """Тела запросов из файла воспроизведения"""
+    mix = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith('{'):
+                try:
+                    line = str(json.loads(line).get('body', line))
+                except ValueError:
+                    pass
+            mix.append(line)
+    return mix
+
+
+def legacy_scan(threat_patterns, text):
+    """Старый алгоритм: отдельный re.search на каждый паттерн"""
+    found = []
+    for threat_type, patterns in threat_patterns.items():
+        for pattern in patterns:
+            if re.search(pattern, text, re.IGNORECASE | re.MULTILINE):
+                found.append((threat_type, pattern))
+    return found
+
+
+def engine_scan(engine, text):
+    """Новый алгоритм: предфильтр литералов или объединённая регулярка на категорию"""
+    return list(engine.iter_matches(text))
+
+
+def legacy_xss(xss, text):
+    """Старая проверка XSSProtection: re.search по каждому паттерну"""
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in xss.malicious_patterns)
+
+
+def measure(name, scan, mix, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in mix:
+            scan(text)
+    elapsed = time.perf_counter() - start
+    total = iterations * len(mix)
+    print(f"{name:>10}: {elapsed:.3f} с, {total / elapsed:,.0f} запросов/с, {elapsed / total * 1e6:.1f} мкс/запрос")
+    return elapsed
+
+
+def run(iterations: int = 200, replay_path: str = None):
+    threat_patterns = threat_detector.threat_patterns
+    combined = ThreatPatternEngine(threat_patterns, prefilter=False)
+    prefiltered = ThreatPatternEngine(threat_patterns)
+    xss = XSSProtection()
+    mix = load_replay(replay_path) if replay_path else build_mix()
+    print(f"Запросов в смеси: {len(mix)}, предфильтр: {prefiltered.prefilter.get_stats()}")
+
+    # Результаты всех алгоритмов должны совпадать
+    for text in mix:
+        expected = legacy_scan(threat_patterns, text)
+        assert expected == engine_scan(combined, text) == engine_scan(prefiltered, text), text
+        assert legacy_xss(xss, text) == xss.has_malicious_pattern(text), text
+
+    results = {}
+    print("Сигнатуры угроз (SecurityThreatDetector):")
+    results['legacy'] = measure('legacy', lambda t: legacy_scan(threat_patterns, t), mix, iterations)
+    results['combined'] = measure('combined', lambda t: engine_scan(combined, t), mix, iterations)
+    results['prefilter'] = measure('prefilter', lambda t: engine_scan(prefiltered, t), mix, iterations)
+    print(f"⚡ Ускорение: x{results['legacy'] / results['combined']:.1f} (combined), "
+          f"x{results['legacy'] / results['prefilter']:.1f} (prefilter)")
+
+    print("Запрещенные паттерны (XSSProtection):")
+    results['xss_legacy'] = measure('legacy', lambda t: legacy_xss(xss, t), mix, iterations)
+    results['xss_prefilter'] = measure('prefilter', xss.has_malicious_pattern, mix, iterations)
+    print(f"⚡ Ускорение: x{results['xss_legacy'] / results['xss_prefilter']:.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200, sys.argv[2] if len(sys.argv) > 2 else None)
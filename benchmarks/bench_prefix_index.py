@@ -0,0 +1,66 @@
+"""
+⏱️ БЕНЧМАРК ИНДЕКСА ПОДСЕТЕЙ
+Проверка блокировки IP при 100 000 заблокированных префиксов IPv4/IPv6
+
+Запуск: python benchmarks/bench_prefix_index.py [префиксов] [проверок]
+"""
+
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from security.blocklist import BlocklistIndex
+
+
+def random_prefix(rng: random.Random) -> str:
+    """Случайная подсеть: 70% IPv4 (/16-/32), 30% IPv6 (/32-/128)"""
+    if rng.random() < 0.7:
+        prefixlen = rng.choice([16, 20, 24, 24, 24, 28, 32])
+        network = ipaddress.IPv4Network((rng.getrandbits(32), prefixlen), strict=False)
+    else:
+        prefixlen = rng.choice([32, 48, 56, 64, 64, 64, 128])
+        network = ipaddress.IPv6Network((rng.getrandbits(128), prefixlen), strict=False)
+    return BlocklistIndex.normalize(str(network))
+
+
+def random_address(rng: random.Random) -> str:
+    if rng.random() < 0.7:
+        return str(ipaddress.IPv4Address(rng.getrandbits(32)))
+    return str(ipaddress.IPv6Address(rng.getrandbits(128)))
+
+
+def run(prefix_count: int = 100_000, lookups: int = 200_000):
+    rng = random.Random(42)
+    index = BlocklistIndex()
+
+    start = time.perf_counter()
+    prefixes = [random_prefix(rng) for _ in range(prefix_count)]
+    for prefix in prefixes:
+        index.add(prefix)
+    build = time.perf_counter() - start
+    print(f"📦 Загружено {len(index._entries):,} префиксов за {build:.2f} с")
+
+    # Половина адресов попадает в заблокированные подсети, половина - случайные
+    addresses = []
+    for i in range(lookups):
+        if i % 2:
+            addresses.append(random_address(rng))
+        else:
+            network = ipaddress.ip_network(rng.choice(prefixes), strict=False)
+            offset = rng.getrandbits(network.max_prefixlen - network.prefixlen) if network.prefixlen < network.max_prefixlen else 0
+            addresses.append(str(network.network_address + offset))
+
+    start = time.perf_counter()
+    hits = sum(1 for address in addresses if address in index)
+    elapsed = time.perf_counter() - start
+    print(f"🔍 {lookups:,} проверок за {elapsed:.2f} с: "
+          f"{lookups / elapsed:,.0f} проверок/с, {elapsed / lookups * 1e6:.2f} мкс/проверка, совпадений {hits:,}")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
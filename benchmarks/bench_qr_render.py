@@ -0,0 +1,91 @@
+"""
+🔳 БЕНЧМАРК РЕНДЕРИНГА QR-КОДОВ 2FA
+Прежний способ (qrcode + PIL, box_size=10, PNG в base64) против QRCodeRenderer:
+PNG из матрицы и компактный SVG - процессорное время и размер ответа
+
+Запуск: python benchmarks/bench_qr_render.py [--renders 200] [--output bench_qr_render.json]
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pyotp
+import qrcode
+
+from security.qr_renderer import QRCodeRenderer
+
+
+def legacy_qr_code(provisioning_uri: str) -> str:
+    """Реализация TwoFactorAuth.get_qr_code до QRCodeRenderer"""
+    qr = qrcode.QRCode(version=1, box_size=10, border=4)
+    qr.add_data(provisioning_uri)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    buffer.seek(0)
+    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def measure(render, uris: list) -> dict:
+    cpu_start = time.process_time()
+    outputs = [render(uri) for uri in uris]
+    cpu = time.process_time() - cpu_start
+    return {
+        'cpu_ms_per_render': round(cpu / len(uris) * 1000, 3),
+        'avg_payload_bytes': round(sum(len(output.encode()) for output in outputs) / len(outputs), 1),
+        # Ответы JSON сжимает Flask-Compress (gzip, уровень 6)
+        'avg_gzip_bytes': round(sum(len(gzip.compress(output.encode(), 6)) for output in outputs) / len(outputs), 1),
+    }
+
+
+def run(renders: int = 200, output: str = None):
+    output = os.path.abspath(output or 'bench_qr_render.json')
+    # Уникальные URI, как при настройке 2FA разными пользователями
+    uris = [pyotp.TOTP(pyotp.random_base32()).provisioning_uri(name=f"user{i}@example.com", issuer_name="CyberGuardian")
+            for i in range(renders)]
+
+    results = {
+        'legacy_png': measure(legacy_qr_code, uris),
+        'png': measure(lambda uri: QRCodeRenderer().render(uri, 'png'), uris),
+        'svg': measure(lambda uri: QRCodeRenderer().render(uri, 'svg'), uris),
+        'png_fixed_mask': measure(lambda uri: QRCodeRenderer(mask_pattern=0).render(uri, 'png'), uris),
+        'svg_fixed_mask': measure(lambda uri: QRCodeRenderer(mask_pattern=0).render(uri, 'svg'), uris),
+    }
+
+    legacy = results['legacy_png']
+    for name, r in results.items():
+        print(f"{name:>14}: {r['cpu_ms_per_render']:.3f} мс CPU  {r['avg_payload_bytes']:>7,.0f} байт  "
+              f"gzip {r['avg_gzip_bytes']:>6,.0f} байт  "
+              f"(x{legacy['cpu_ms_per_render'] / max(r['cpu_ms_per_render'], 1e-6):.1f} по CPU, "
+              f"x{legacy['avg_payload_bytes'] / r['avg_payload_bytes']:.1f} по размеру)")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'renders': renders,
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {output}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарк рендеринга QR-кодов 2FA')
+    parser.add_argument('--renders', type=int, default=200)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    run(args.renders, args.output)
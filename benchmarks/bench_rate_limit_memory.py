@@ -0,0 +1,64 @@
+"""
+⏱️ ПАМЯТЬ ОГРАНИЧИТЕЛЯ СКОРОСТИ
+Сравнение старого журнала меток времени (deque на IP) с корзинами SlidingWindowCounter
+
+Запуск: python benchmarks/bench_rate_limit_memory.py [число IP] [запросов на IP]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from security.rate_limit_backends import MemoryRateLimitBackend
+
+
+def ip_for(i: int) -> str:
+    return f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+
+def legacy_fill(ips: int, hits: int):
+    """Старая структура RateLimiter.request_counts: {ip: deque(timestamps)}"""
+    request_counts = defaultdict(deque)
+    now = time.time()
+    for i in range(ips):
+        timestamps = request_counts[f"rl:general:{ip_for(i)}"]
+        for _ in range(hits):
+            timestamps.append(now)
+    return request_counts
+
+
+def backend_fill(ips: int, hits: int):
+    backend = MemoryRateLimitBackend()
+    for i in range(ips):
+        key = f"rl:general:{ip_for(i)}"
+        for _ in range(hits):
+            backend.hit(key, 3600, 100)
+    return backend
+
+
+def measure(name: str, fill, ips: int, hits: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    state = fill(ips, hits)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {current / 1024 / 1024:,.1f} МБ ({current / ips:,.0f} байт/IP), заполнение {elapsed:.1f} с")
+    del state
+    return current
+
+
+def run(ips: int = 1_000_000, hits: int = 1):
+    print(f"📊 {ips:,} IP по {hits} запрос(ов)")
+    legacy = measure('legacy', legacy_fill, ips, hits)
+    buckets = measure('buckets', backend_fill, ips, hits)
+    print(f"💾 Экономия памяти: x{legacy / buckets:.1f}")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,221 @@
+"""
+⏱️ НАГРУЗОЧНЫЙ БЕНЧМАРК ЦЕПОЧКИ БЕЗОПАСНОСТИ
+Воспроизведение смеси запросов через Flask test client: setup_security целиком
+и с отключением каждой стадии (отпечаток сессии, IPS, валидация входных данных)
+
+Запуск: python benchmarks/bench_security_chain.py [--requests 2000]
+        [--mix clean=60,static=20,login=10,attack=10] [--output bench_security_chain.json]
+
+Приложение импортируется во временном каталоге: instance/ и backups/ репозитория не меняются.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MIX = 'clean=60,static=20,login=10,attack=10'
+
+# Запросы по видам трафика: (метод, путь, данные формы)
+TRAFFIC = {
+    'clean': [
+        ('GET', '/', None),
+        ('GET', '/education/', None),
+        ('GET', '/auth/login', None),
+        ('GET', '/education/?page=2&sort=new', None),
+    ],
+    'static': [
+        ('GET', '/static/css/main.css', None),
+        ('GET', '/static/js/main.js', None),
+        ('GET', '/favicon.ico', None),
+        ('GET', '/robots.txt', None),
+    ],
+    'login': [
+        ('POST', '/auth/login', {'username': 'demo', 'password': 'Sup3rSecret!'}),
+        ('POST', '/auth/login', {'username': 'student42', 'password': 'CorrectHorseBatteryStaple1'}),
+    ],
+    'attack': [
+        ('GET', '/education/?id=1 union select username, password from users', None),
+        ('GET', '/education/?file=../../../../etc/passwd', None),
+        ('POST', '/auth/login', {'username': "admin'; --", 'password': 'x'}),
+        ('POST', '/auth/login', {'username': '<script>alert(document.cookie)</script>', 'password': 'x'}),
+        ('GET', '/?host=127.0.0.1;+rm+-rf+/tmp/x', None),
+    ],
+}
+
+# Варианты цепочки: какие стадии setup_security отключены
+VARIANTS = {
+    'full': (),
+    'no_session_fingerprint': ('session',),
+    'no_ips': ('ips',),
+    'no_validation': ('validation',),
+    'none': ('session', 'ips', 'validation'),
+}
+
+
+class _NoSessionSecurity:
+    """Заглушка session_security: ID сессии выдается, отпечаток не сохраняется"""
+
+    def ensure_session(self, request):
+        from flask import session
+        return session.setdefault('session_id', secrets.token_urlsafe(32))
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in TRAFFIC:
+            raise SystemExit(f"Неизвестный вид трафика: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def build_schedule(weights: dict, count: int, seed: int = 42) -> list:
+    """Последовательность (вид трафика, запрос), одинаковая для всех вариантов"""
+    rng = random.Random(seed)
+    kinds = list(weights)
+    schedule = []
+    for kind in rng.choices(kinds, weights=[weights[k] for k in kinds], k=count):
+        schedule.append((kind, rng.choice(TRAFFIC[kind])))
+    return schedule
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'rps': round(len(values) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+    }
+
+
+class ChainPatch:
+    """Временное отключение стадий setup_security через имена модуля app"""
+
+    def __init__(self, app_module, disabled):
+        self.app_module = app_module
+        self.disabled = disabled
+        self.saved = {}
+
+    def __enter__(self):
+        replacements = {
+            'session': ('session_security', _NoSessionSecurity()),
+            'ips': ('security_middleware', lambda: None),
+            'validation': ('security_validation_middleware', lambda: None),
+        }
+        for stage in self.disabled:
+            name, replacement = replacements[stage]
+            self.saved[name] = getattr(self.app_module, name)
+            setattr(self.app_module, name, replacement)
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self.saved.items():
+            setattr(self.app_module, name, original)
+
+
+def run_variant(app_module, schedule: list, disabled: tuple, ip_prefix: int, warmup: int) -> dict:
+    """Прогон расписания; каждый запрос - со своего IP, чтобы не упираться в лимиты и блокировки"""
+    client = app_module.app.test_client(use_cookies=False)
+    by_kind = {}
+    latencies = []
+    statuses = {}
+
+    def send(index, method, path, form):
+        ip = f"10.{ip_prefix}.{(index >> 8) & 255}.{index & 255}"
+        return client.open(path, method=method, data=form, headers={'X-Forwarded-For': ip})
+
+    with ChainPatch(app_module, disabled), contextlib.redirect_stdout(io.StringIO()):
+        for index, (_, (method, path, form)) in enumerate(schedule[:warmup]):
+            send(60000 + index, method, path, form)
+
+        start = time.perf_counter()
+        for index, (kind, (method, path, form)) in enumerate(schedule):
+            request_start = time.perf_counter()
+            response = send(index, method, path, form)
+            latency = time.perf_counter() - request_start
+            latencies.append(latency)
+            by_kind.setdefault(kind, []).append(latency)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, elapsed)
+    result['by_traffic'] = {kind: summarize(values, sum(values)) for kind, values in by_kind.items()}
+    result['statuses'] = {str(code): count for code, count in sorted(statuses.items())}
+    return result
+
+
+def run(requests: int = 2000, mix: str = DEFAULT_MIX, output: str = None, warmup: int = 100):
+    output = os.path.abspath(output or 'bench_security_chain.json')
+    workdir = tempfile.mkdtemp(prefix='cyberguardian-bench-')
+    os.chdir(workdir)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+
+    schedule = build_schedule(parse_mix(mix), requests)
+    results = {}
+    for ip_prefix, (variant, disabled) in enumerate(VARIANTS.items(), 1):
+        results[variant] = run_variant(app_module, schedule, disabled, ip_prefix, warmup)
+        r = results[variant]
+        print(f"{variant:>24}: {r['rps']:>8,.0f} запросов/с  p50 {r['p50_ms']:.2f} мс  "
+              f"p95 {r['p95_ms']:.2f} мс  p99 {r['p99_ms']:.2f} мс")
+
+    # Цена стадий по видам трафика: насколько медиана с полной цепочкой выше, чем без стадии.
+    # По смеси целиком сравнивать нельзя: без IPS атаки доходят до обработчиков и стоят дороже
+    full = results['full']['by_traffic']
+    stage_cost = {
+        variant: {kind: round(full[kind]['p50_ms'] - results[variant]['by_traffic'][kind]['p50_ms'], 3)
+                  for kind in full}
+        for variant in VARIANTS if variant != 'full'
+    }
+    for variant, costs in stage_cost.items():
+        print(f"⏱️ {variant}: цена стадий (p50, мс) {costs}")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'requests': requests,
+        'mix': mix,
+        'warmup': warmup,
+        'variants': results,
+        'stage_cost_p50_ms': stage_cost,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {output}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочный бенчмарк цепочки before_request')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    run(args.requests, args.mix, args.output, args.warmup)
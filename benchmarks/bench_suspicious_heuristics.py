@@ -0,0 +1,67 @@
+"""
+⏱️ БЕНЧМАРК ЭВРИСТИК ПОДОЗРИТЕЛЬНЫХ ЗАПРОСОВ
+Поток запросов с одного IP: старый список меток времени и regex по User-Agent
+против счетчика минуты из корзин и кэша классификации User-Agent
+
+Запуск: python benchmarks/bench_suspicious_heuristics.py [запросов]
+"""
+
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Version/17.0 Mobile Safari/604.1',
+    'python-requests/2.31.0',
+    'sqlmap/1.7.2#stable (https://sqlmap.org)',
+]
+
+
+def legacy_is_suspicious(patterns, activity, request_data):
+    """Старый алгоритм: regex по каждой сигнатуре и список меток за минуту (deque до 100)"""
+    indicators = 0
+    user_agent = request_data['user_agent'].lower()
+    for pattern in patterns:
+        if re.search(pattern, user_agent, re.IGNORECASE):
+            indicators += 1
+    requests = activity.setdefault(request_data['ip'], deque(maxlen=100))
+    requests.append(time.time())
+    recent = [t for t in requests if time.time() - t < 60]
+    if len(recent) > 50:
+        indicators += 1
+    return indicators >= 2
+
+
+def run(requests: int = 10000):
+    # Детектор создает instance/threats.db - во временном каталоге
+    os.chdir(tempfile.mkdtemp(prefix='cyberguardian-bench-'))
+    from security.intrusion_prevention import threat_detector
+
+    patterns = threat_detector.threat_patterns['suspicious_user_agents']
+    flood = [{'ip': '198.51.100.7', 'user_agent': USER_AGENTS[i % len(USER_AGENTS)], 'data_size': 128}
+             for i in range(requests)]
+
+    activity = {}
+    start = time.perf_counter()
+    legacy = [legacy_is_suspicious(patterns, activity, r) for r in flood]
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    current = [threat_detector.is_suspicious_request(r) for r in flood]
+    current_elapsed = time.perf_counter() - start
+
+    assert legacy == current
+    for name, elapsed in (('legacy', legacy_elapsed), ('buckets', current_elapsed)):
+        print(f"{name:>8}: {requests / elapsed:,.0f} проверок/с, {elapsed / requests * 1e6:.2f} мкс/проверку")
+    print(f"⚡ Ускорение: x{legacy_elapsed / current_elapsed:.1f}, подозрительных: {sum(current)} из {requests}")
+    print(f"🧠 Кэш User-Agent: {threat_detector.user_agent_cache.get_stats()}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
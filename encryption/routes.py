@@ -11,6 +11,7 @@ import re
 
 # Импортируем blueprint из __init__.py
 from . import encryption_bp
+from security.web_protection import input_policy
 
 def add_to_history(user_id, operation_type, algorithm, original_text, processed_text, filename="operation"):
     # Генерируем имя файла на основе времени
@@ -40,6 +41,7 @@ def encryption_tools():
     return render_template('encryption/tools.html')
 
 @encryption_bp.route('/text', methods=['GET', 'POST'])
+@input_policy(text='skip', password='skip')
 def text_encryption():
     if request.method == 'POST':
         try:
@@ -97,6 +99,7 @@ def text_encryption():
     return render_template('encryption/text.html')
 
 @encryption_bp.route('/decrypt', methods=['POST'])
+@input_policy(encrypted_text='skip', password='skip', salt='skip')
 def decrypt_text():
     try:
         data = request.get_json()
@@ -9,6 +9,7 @@ import json
 from datetime import datetime
 from collections import Counter
 import hashlib
+from security.web_protection import input_policy
 
 class PasswordGenerator:
     @staticmethod
@@ -415,6 +416,7 @@ def generate_password():
         return jsonify({'error': f'Ошибка генерации: {str(e)}'}), 500
 
 @passwords_bp.route('/check-strength', methods=['POST'])
+@input_policy(password='skip')
 def check_password_strength():
     """API для проверки надежности пароля"""
     try:
@@ -447,6 +449,7 @@ def check_password_strength():
         return jsonify({'error': f'Ошибка проверки: {str(e)}'}), 500
 
 @passwords_bp.route('/advanced-analysis', methods=['POST'])
+@input_policy(password='skip')
 def advanced_analysis():
     """Расширенный анализ пароля"""
     try:
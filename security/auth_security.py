@@ -7,9 +7,6 @@ import time
 import hashlib
 import secrets
 import pyotp
-import qrcode
-from io import BytesIO
-import base64
 from typing import Dict, Optional, Tuple
 from flask import request, session, g, abort, jsonify, render_template_string
 from functools import wraps
@@ -17,14 +14,19 @@ from datetime import datetime, timedelta
 import sqlite3
 import os
 import re
-from collections import defaultdict, deque
+
+from security.rate_limit_backends import MemoryRateLimitBackend
+from security.two_factor_store import TwoFactorStore
+from security.qr_renderer import qr_renderer, QR_FORMATS
+from security.stage_metrics import stage_metrics
 
 class RateLimiter:
     """🚦 Система ограничения скорости запросов"""
     
-    def __init__(self):
-        self.request_counts = defaultdict(deque)  # {ip: [timestamps]}
-        self.blocked_ips = {}  # {ip: {blocked_until, reason}}
+    def __init__(self, backend=None):
+        # Хранилище счетчиков и блокировок (память процесса или общее для воркеров)
+        self.backend = backend or MemoryRateLimitBackend()
+        self.block_duration = 3600  # 1 час блокировки
         self.rate_limits = {
             'general': {'requests': 100, 'window': 3600},      # 100 запросов в час
             'login': {'requests': 5, 'window': 900},           # 5 попыток входа в 15 минут
@@ -35,56 +37,36 @@ class RateLimiter:
     
     def is_rate_limited(self, ip: str, limit_type: str = 'general') -> bool:
         """Проверка ограничений скорости"""
-        current_time = time.time()
         limit_config = self.rate_limits.get(limit_type, self.rate_limits['general'])
         max_requests = limit_config['requests']
         window_seconds = limit_config['window']
         
         # Проверяем, не заблокирован ли IP
-        if ip in self.blocked_ips:
-            blocked_info = self.blocked_ips[ip]
-            if current_time < blocked_info['blocked_until']:
-                return True
-            else:
-                # Убираем истекшую блокировку
-                del self.blocked_ips[ip]
-        
-        # Получаем список временных меток для этого IP
-        timestamps = self.request_counts[ip]
+        if self.backend.get_block(f"rl:{ip}") is not None:
+            return True
         
-        # Удаляем старые временные метки
-        while timestamps and current_time - timestamps[0] > window_seconds:
-            timestamps.popleft()
+        # Учитываем запрос, если лимит еще не исчерпан
+        allowed, count = self.backend.hit(f"rl:{limit_type}:{ip}", window_seconds, max_requests)
         
-        # Проверяем лимит
-        if len(timestamps) >= max_requests:
+        if not allowed:
             # Блокируем IP
-            block_duration = 3600  # 1 час блокировки
-            self.blocked_ips[ip] = {
-                'blocked_until': current_time + block_duration,
-                'reason': f'Превышен лимит {limit_type}: {len(timestamps)}/{max_requests}'
-            }
+            self.backend.block(
+                f"rl:{ip}",
+                time.time() + self.block_duration,
+                f'Превышен лимит {limit_type}: {count}/{max_requests}'
+            )
             return True
         
-        # Добавляем текущую временную метку
-        timestamps.append(current_time)
         return False
     
     def get_rate_limit_info(self, ip: str, limit_type: str = 'general') -> Dict:
         """Получение информации о лимитах для IP"""
-        current_time = time.time()
         limit_config = self.rate_limits.get(limit_type, self.rate_limits['general'])
         max_requests = limit_config['requests']
         window_seconds = limit_config['window']
         
-        timestamps = self.request_counts[ip]
-        
         # Считаем активные запросы (не старше окна)
-        active_requests = len([t for t in timestamps if current_time - t <= window_seconds])
-        
-        # Вычисляем время до сброса
-        reset_time = max(timestamps) if timestamps else current_time
-        time_to_reset = max(0, (reset_time + window_seconds) - current_time)
+        active_requests, time_to_reset = self.backend.get(f"rl:{limit_type}:{ip}", window_seconds)
         
         return {
             'current_requests': active_requests,
@@ -92,42 +74,29 @@ class RateLimiter:
             'window_seconds': window_seconds,
             'time_to_reset': time_to_reset,
             'remaining_requests': max(0, max_requests - active_requests),
-            'is_blocked': self.is_rate_limited(ip, limit_type)
+            'is_blocked': self.backend.get_block(f"rl:{ip}") is not None
         }
 
 class TwoFactorAuth:
     """🔐 Двухфакторная аутентификация (2FA)"""
     
-    def __init__(self):
-        self.secret_keys = {}  # {user_id: secret_key}
-        self.backup_codes = {}  # {user_id: [backup_codes]}
+    def __init__(self, store=None):
+        # Секреты и резервные коды в общей БД; замена - configure_two_factor_store
+        self.store = store or TwoFactorStore()
     
     def generate_secret_key(self) -> str:
         """Генерация секретного ключа для 2FA"""
         return pyotp.random_base32()
     
-    def get_qr_code(self, user_email: str, secret_key: str) -> str:
-        """Получение QR кода для настройки 2FA"""
+    def get_qr_code(self, user_email: str, secret_key: str, fmt: str = 'png') -> str:
+        """Получение QR кода для настройки 2FA (png - data URI, svg - разметка)"""
         totp = pyotp.TOTP(secret_key)
         provisioning_uri = totp.provisioning_uri(
             name=user_email,
             issuer_name="CyberGuardian"
         )
         
-        # Создаем QR код
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(provisioning_uri)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Преобразуем в base64 для отображения в браузере
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
-        return f"data:image/png;base64,{img_base64}"
+        return qr_renderer.render(provisioning_uri, fmt)
     
     def generate_backup_codes(self) -> list:
         """Генерация резервных кодов"""
@@ -143,89 +112,71 @@ class TwoFactorAuth:
         totp = pyotp.TOTP(secret_key)
         return totp.verify(token, valid_window=1)  # Допускаем 1 окно рассинхронизации
     
-    def enable_2fa(self, user_id: int, user_email: str) -> Tuple[str, str, list]:
+    def enable_2fa(self, user_id: int, user_email: str, qr_format: str = 'png') -> Tuple[str, str, list]:
         """Включение 2FA для пользователя"""
         secret_key = self.generate_secret_key()
-        qr_code = self.get_qr_code(user_email, secret_key)
+        qr_code = self.get_qr_code(user_email, secret_key, qr_format)
         backup_codes = self.generate_backup_codes()
         
-        # Сохраняем данные
-        self.secret_keys[user_id] = secret_key
-        self.backup_codes[user_id] = backup_codes
+        # Сохраняем данные (секрет зашифрован, коды только в виде хешей)
+        self.store.save(user_id, secret_key, backup_codes)
         
         return secret_key, qr_code, backup_codes
     
     def disable_2fa(self, user_id: int):
         """Отключение 2FA"""
-        self.secret_keys.pop(user_id, None)
-        self.backup_codes.pop(user_id, None)
+        self.store.delete(user_id)
     
     def is_2fa_enabled(self, user_id: int) -> bool:
         """Проверка включен ли 2FA"""
-        return user_id in self.secret_keys
+        return self.store.is_enabled(user_id)
+    
+    def get_secret_key(self, user_id: int) -> Optional[str]:
+        """Секрет TOTP пользователя"""
+        return self.store.get_secret(user_id)
+    
+    def verify_backup_code(self, user_id: int, code: str) -> bool:
+        """Проверка одноразового резервного кода"""
+        if not code or not code.isdigit():
+            return False
+        return self.store.consume_backup_code(user_id, code)
 
 class BruteForceProtection:
     """🛡️ Защита от Brute Force атак"""
     
-    def __init__(self):
-        self.failed_attempts = defaultdict(list)  # {ip: [attempt_times]}
-        self.blocked_ips = {}  # {ip: {blocked_until, reason}}
+    def __init__(self, backend=None):
+        # Хранилище попыток и блокировок (память процесса или общее для воркеров)
+        self.backend = backend or MemoryRateLimitBackend()
         self.max_attempts = 5  # Максимум попыток
         self.block_duration = 1800  # 30 минут блокировки
         self.attempt_window = 900  # 15 минут окно
     
     def record_failed_attempt(self, ip: str):
         """Запись неудачной попытки входа"""
-        current_time = time.time()
-        
-        # Получаем список попыток для IP
-        attempts = self.failed_attempts[ip]
-        
-        # Удаляем старые попытки
-        while attempts and current_time - attempts[0] > self.attempt_window:
-            attempts.pop(0)
-        
-        # Добавляем текущую попытки
-        attempts.append(current_time)
+        _, attempts = self.backend.hit(f"bf:{ip}", self.attempt_window, self.max_attempts)
         
         # Проверяем, нужно ли блокировать
-        if len(attempts) >= self.max_attempts:
+        if attempts >= self.max_attempts:
             self.block_ip(ip, "Множественные неудачные попытки входа")
     
     def block_ip(self, ip: str, reason: str):
         """Блокировка IP за Brute Force"""
-        current_time = time.time()
-        self.blocked_ips[ip] = {
-            'blocked_until': current_time + self.block_duration,
-            'reason': reason
-        }
+        self.backend.block(f"bf:{ip}", time.time() + self.block_duration, reason)
     
     def is_ip_blocked(self, ip: str) -> bool:
         """Проверка блокировки IP"""
-        if ip not in self.blocked_ips:
-            return False
-        
-        blocked_info = self.blocked_ips[ip]
-        if time.time() < blocked_info['blocked_until']:
+        if self.backend.get_block(f"bf:{ip}") is not None:
             return True
-        else:
-            # Убираем истекшую блокировку
-            del self.blocked_ips[ip]
-            # Очищаем попытки
-            self.failed_attempts[ip] = []
-            return False
+        return False
     
     def record_successful_attempt(self, ip: str):
         """Запись успешной попытки (сбрасывает счетчик)"""
-        self.failed_attempts[ip] = []
+        self.backend.reset(f"bf:{ip}")
     
     def get_attempts_info(self, ip: str) -> Dict:
         """Получение информации о попытках для IP"""
-        current_time = time.time()
-        attempts = self.failed_attempts[ip]
-        
         # Считаем активные попытки
-        active_attempts = len([t for t in attempts if current_time - t <= self.attempt_window])
+        active_attempts, _ = self.backend.get(f"bf:{ip}", self.attempt_window)
         
         return {
             'failed_attempts': active_attempts,
@@ -269,6 +220,15 @@ class SessionSecurity:
         fingerprint = self.generate_session_fingerprint(request)
         self.session_fingerprints[session_id] = fingerprint
     
+    def ensure_session(self, request) -> str:
+        """ID сессии с сохраненным отпечатком; создается при первой необходимости"""
+        session_id = session.get('session_id')
+        if session_id is None:
+            session_id = session['session_id'] = secrets.token_urlsafe(32)
+            with stage_metrics.time('session_fingerprint'):
+                self.store_session_fingerprint(session_id, request)
+        return session_id
+    
     def invalidate_session(self, session_id: str):
         """Аннулирование сессии"""
         self.session_fingerprints.pop(session_id, None)
@@ -279,6 +239,15 @@ two_factor_auth = TwoFactorAuth()
 brute_force_protection = BruteForceProtection()
 session_security = SessionSecurity()
 
+def configure_rate_limit_backend(backend):
+    """Подключение хранилища лимитов (см. RATE_LIMIT_BACKEND в конфигурации)"""
+    rate_limiter.backend = backend
+    brute_force_protection.backend = backend
+
+def configure_two_factor_store(store):
+    """Подключение хранилища 2FA (ключ шифрования задается в create_app)"""
+    two_factor_auth.store = store
+
 def rate_limit(limit_type: str = 'general'):
     """Декоратор для ограничения скорости"""
     def decorator(f):
@@ -345,13 +314,19 @@ def setup_enhanced_auth_routes():
         user_email = session.get('user_email', '')
         
         if request.method == 'POST':
+            # Формат QR: png (data URI, по умолчанию) или компактный svg
+            qr_format = request.args.get('qr_format', 'png')
+            if qr_format not in QR_FORMATS:
+                return jsonify({'error': 'Неизвестный формат QR-кода'}), 400
+            
             # Включаем 2FA
-            secret_key, qr_code, backup_codes = two_factor_auth.enable_2fa(user_id, user_email)
+            secret_key, qr_code, backup_codes = two_factor_auth.enable_2fa(user_id, user_email, qr_format)
             
             return jsonify({
                 'success': True,
                 'secret_key': secret_key,
                 'qr_code': qr_code,
+                'qr_format': qr_format,
                 'backup_codes': backup_codes
             })
         
@@ -371,9 +346,11 @@ def setup_enhanced_auth_routes():
         if not two_factor_auth.is_2fa_enabled(user_id):
             return jsonify({'error': '2FA не включен'}), 400
         
-        secret_key = two_factor_auth.secret_keys[user_id]
+        secret_key = two_factor_auth.get_secret_key(user_id)
         
-        if two_factor_auth.verify_totp(secret_key, token):
+        # 6 цифр - код TOTP, 8 цифр - резервный код
+        if ((secret_key and two_factor_auth.verify_totp(secret_key, token))
+                or (len(token) == 8 and two_factor_auth.verify_backup_code(user_id, token))):
             session['2fa_verified'] = True
             brute_force_protection.record_successful_attempt(
                 request.headers.get('X-Forwarded-For', request.remote_addr)
@@ -0,0 +1,283 @@
+"""
+📊 ПАКЕТНАЯ ПРОВЕРКА ЖУРНАЛОВ ЗАПРОСОВ
+CyberGuardian - Прогон сигнатур по историческим запросам без блокировок и записи в БД
+
+Форматы входа (по строке на запрос):
+- JSON lines: {"method", "path", "query", "body", "content_type", "user_agent", "label"}
+- access log (common/combined): 127.0.0.1 - - [...] "GET /path?q=1 HTTP/1.1" 200 512 "-" "UA"
+
+Запуск:
+    python -m security.batch_scan access.log requests.jsonl --processes 4 --json report.json
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from security.body_inspector import StreamingBodyInspector
+from security.detection_rules import THREAT_PATTERNS, SCAN_EXCLUDED_CATEGORIES, classify_request, url_payload
+from security.pattern_engine import ThreatPatternEngine
+
+ACCESS_LOG_LINE = re.compile(
+    r'"(?P<method>[A-Z]+) (?P<target>\S+)[^"]*" (?P<status>\d{3}) \S+(?: "[^"]*" "(?P<user_agent>[^"]*)")?'
+)
+
+# Метки чистого трафика во входных данных
+CLEAN_LABELS = frozenset({'clean', 'benign', 'ok', 'false'})
+
+_engine = None
+_inspector = None
+
+
+def parse_line(line: str, line_number: int) -> Optional[Dict]:
+    """Запрос из строки JSON lines или access log; None для нераспознанной строки"""
+    line = line.strip()
+    if not line:
+        return None
+
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        path = record.get('path') or record.get('url') or '/'
+        query = record.get('query') or record.get('query_string') or ''
+        if '?' in path and not query:
+            path, query = path.split('?', 1)
+        body = record.get('body') or ''
+        return {
+            'line': line_number,
+            'method': (record.get('method') or ('POST' if body else 'GET')).upper(),
+            'path': path,
+            'query': query,
+            'body': body if isinstance(body, str) else json.dumps(body, ensure_ascii=False),
+            'content_type': record.get('content_type', ''),
+            'user_agent': record.get('user_agent', ''),
+            'label': record.get('label')
+        }
+
+    match = ACCESS_LOG_LINE.search(line)
+    if match is None:
+        return None
+    path, _, query = match.group('target').partition('?')
+    return {
+        'line': line_number,
+        'method': match.group('method'),
+        'path': path,
+        'query': query,
+        'body': '',
+        'content_type': '',
+        'user_agent': match.group('user_agent') or '',
+        'label': None,
+        'status': int(match.group('status'))
+    }
+
+
+def iter_file_requests(paths: Iterable[str]) -> Iterator[Dict]:
+    """Запросы из файлов ('-' - stdin)"""
+    for path in paths:
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', errors='replace')
+        try:
+            for line_number, line in enumerate(stream, 1):
+                record = parse_line(line, line_number)
+                if record is not None:
+                    record['source'] = path
+                    yield record
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def _init_worker():
+    """Движок сигнатур компилируется один раз в каждом процессе пула"""
+    global _engine, _inspector
+    _engine = ThreatPatternEngine(THREAT_PATTERNS)
+    _inspector = StreamingBodyInspector()
+
+
+def _default_engine():
+    """Движок и инспектор процесса; создаются при первом вызове вне пула"""
+    if _engine is None:
+        _init_worker()
+    return _engine, _inspector
+
+
+def scan_request(record: Dict, engine: ThreatPatternEngine = None,
+                 inspector: StreamingBodyInspector = None) -> Dict:
+    """Проверка одного запроса так же, как в security_middleware, но без побочных эффектов"""
+    if engine is None or inspector is None:
+        default_engine, default_inspector = _default_engine()
+        engine = engine or default_engine
+        inspector = inspector or default_inspector
+    body = record.get('body') or ''
+    body_bytes = body.encode('utf-8')
+    request_class = classify_request(record.get('path', '/'), record.get('method', 'GET'), len(body_bytes))
+
+    if request_class in ('static', 'monitoring'):
+        return {'request_class': request_class, 'matches': [], 'bytes': len(body_bytes)}
+
+    if request_class == 'url_only':
+        windows = [url_payload(record.get('path', '/'), record.get('query', ''))]
+    else:
+        content_type = record.get('content_type') or ''
+        url_encoded = (content_type.startswith('application/x-www-form-urlencoded')
+                       or (not content_type and not body.lstrip().startswith(('{', '['))))
+        windows = list(inspector.iter_windows(io.BytesIO(body_bytes), url_encoded))
+
+    exclude = SCAN_EXCLUDED_CATEGORIES.get(request_class, ())
+    matches = []
+    for window in windows:
+        for match in engine.iter_matches(window, exclude=exclude):
+            if match not in matches:
+                matches.append(match)
+    return {'request_class': request_class, 'matches': matches, 'bytes': len(body_bytes)}
+
+
+def _is_false_positive_candidate(record: Dict, matches: List) -> Optional[str]:
+    """Причина считать срабатывание возможно ложным или None"""
+    label = record.get('label')
+    if label is not None and str(label).lower() in CLEAN_LABELS:
+        return 'помечен как чистый'
+    status = record.get('status')
+    if status is not None and status < 400:
+        return f'сервер ответил {status}'
+    if len(matches) == 1:
+        return 'единственный паттерн'
+    return None
+
+
+def _scan_chunk(chunk: List[Dict], max_examples: int = 20) -> Dict:
+    """Частичный отчет по пачке запросов (выполняется в процессе пула)"""
+    hits = Counter()
+    classes = Counter()
+    fp_hits = Counter()
+    examples = []
+    flagged = 0
+    total_bytes = 0
+
+    for record in chunk:
+        result = scan_request(record)
+        classes[result['request_class']] += 1
+        total_bytes += result['bytes']
+        matches = result['matches']
+        if not matches:
+            continue
+
+        flagged += 1
+        for threat_type, pattern in matches:
+            hits[f'{threat_type}: {pattern}'] += 1
+
+        reason = _is_false_positive_candidate(record, matches)
+        if reason is not None:
+            for threat_type, pattern in matches:
+                fp_hits[f'{threat_type}: {pattern}'] += 1
+            if len(examples) < max_examples:
+                examples.append({
+                    'source': record.get('source'),
+                    'line': record.get('line'),
+                    'method': record.get('method'),
+                    'path': record.get('path'),
+                    'patterns': [f'{threat_type}: {pattern}' for threat_type, pattern in matches],
+                    'reason': reason
+                })
+
+    return {
+        'requests': len(chunk), 'bytes': total_bytes, 'flagged': flagged,
+        'hits': hits, 'classes': classes, 'fp_hits': fp_hits, 'examples': examples
+    }
+
+
+def _chunks(records: Iterable[Dict], chunk_size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def scan_requests(records: Iterable[Dict], processes: Optional[int] = None, chunk_size: int = 500,
+                  max_examples: int = 50) -> Dict:
+    """Пакетная проверка запросов: срабатывания по паттернам, кандидаты в ложные, пропускная способность"""
+    processes = processes or os.cpu_count() or 1
+    totals = {'requests': 0, 'bytes': 0, 'flagged': 0}
+    hits, classes, fp_hits = Counter(), Counter(), Counter()
+    examples = []
+
+    start = time.perf_counter()
+    if processes == 1:
+        _init_worker()
+        results = (_scan_chunk(chunk) for chunk in _chunks(records, chunk_size))
+        pool = None
+    else:
+        # Пачки передаются в пул лениво: файл не загружается в память целиком
+        pool = Pool(processes, initializer=_init_worker)
+        results = pool.imap(_scan_chunk, _chunks(records, chunk_size))
+
+    try:
+        for partial in results:
+            for key in totals:
+                totals[key] += partial[key]
+            hits.update(partial['hits'])
+            classes.update(partial['classes'])
+            fp_hits.update(partial['fp_hits'])
+            examples.extend(partial['examples'][:max_examples - len(examples)])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        **totals,
+        'request_classes': dict(classes),
+        'pattern_hits': dict(hits.most_common()),
+        'false_positive_candidates': {
+            'by_pattern': dict(fp_hits.most_common()),
+            'examples': examples
+        },
+        'throughput': {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(totals['requests'] / elapsed, 1) if elapsed else None,
+            'megabytes_per_second': round(totals['bytes'] / elapsed / 1e6, 3) if elapsed else None,
+            'processes': processes,
+            'chunk_size': chunk_size
+        }
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Пакетная проверка журналов запросов сигнатурами CyberGuardian')
+    parser.add_argument('files', nargs='+', help="Файлы JSON lines или access log ('-' - stdin)")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--examples', type=int, default=50)
+    parser.add_argument('--json', dest='json_path', help='Сохранить полный отчет в JSON')
+    args = parser.parse_args(argv)
+
+    report = scan_requests(iter_file_requests(args.files), args.processes, args.chunk_size, args.examples)
+
+    throughput = report['throughput']
+    print(f"📊 Запросов: {report['requests']}, с угрозами: {report['flagged']}, "
+          f"{throughput['requests_per_second']} запросов/с ({throughput['processes']} процессов)")
+    for pattern, count in list(report['pattern_hits'].items())[:20]:
+        suspect = report['false_positive_candidates']['by_pattern'].get(pattern, 0)
+        print(f"{count:>8}  {pattern}" + (f"  (возможно ложных: {suspect})" if suspect else ''))
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчет сохранен: {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+🚫 ИНДЕКС БЛОКИРОВОК IP В ПАМЯТИ
+CyberGuardian - Проверка блокировки за O(1) без обращения к БД
+"""
+
+import ipaddress
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from security.prefix_index import PrefixIndex
+from security.event_log import security_events
+
+# Метка снятой блокировки в журнале локальных изменений
+_REMOVED = object()
+
+
+class BlocklistIndex:
+    """🚫 Заблокированные IP и подсети со сроком действия (None - бессрочно)"""
+
+    def __init__(self, sweep_every: int = 1000, local_grace: float = None):
+        self._entries = {}  # {ip или подсеть: expires_at (epoch) или None}
+        self._prefixes = PrefixIndex()  # подсети вида 10.0.0.0/24, 2001:db8::/64
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._operations = 0
+
+        # Фоновое перечитывание БД: изменения этого процесса, которые писатель еще не записал в БД,
+        # переживают перезагрузку, но не дольше local_grace (потом индекс перечитывается из БД)
+        self.local_grace = local_grace if local_grace is not None else float(
+            os.getenv('SECURITY_BLOCKLIST_LOCAL_GRACE', 30))
+        # {ip: (expires_at или _REMOVED, time.monotonic(), written)}; written - threading.Event,
+        # который писатель выставляет после записи (None - изменение не требует записи)
+        self._local = {}
+        self._track_local = False
+        self._refresh_thread = None
+        self._refresh_pid = None
+        self._refresh_stop = threading.Event()
+        self.refresh_stats = {'checks': 0, 'reloads': 0, 'errors': 0}
+
+    @staticmethod
+    def to_epoch(expires_at) -> Optional[float]:
+        """Преобразование expires_at из БД (datetime или строка) в epoch"""
+        if expires_at is None or expires_at == '':
+            return None
+        if isinstance(expires_at, (int, float)):
+            return float(expires_at)
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        return expires_at.timestamp()
+
+    @staticmethod
+    def normalize(value: str) -> str:
+        """Канонический вид IP или подсети; ValueError для некорректного ввода"""
+        value = value.strip()
+        if '/' in value:
+            network = ipaddress.ip_network(value, strict=False)
+            if network.prefixlen < network.max_prefixlen:
+                return str(network)
+            value = str(network.network_address)
+        return str(ipaddress.ip_address(value))
+
+    @staticmethod
+    def client_address(value: str) -> str:
+        """Ключ поиска клиента: первый адрес X-Forwarded-For в каноническом виде (как есть, если это не IP)"""
+        # X-Forwarded-For может содержать цепочку "клиент, прокси1, ...": ключ - первый адрес
+        first = value.split(',', 1)[0].strip()
+        try:
+            return str(ipaddress.ip_address(first))
+        except ValueError:
+            return first
+
+    @staticmethod
+    def _network(key: str):
+        """Подсеть для ключа-диапазона или None для одиночного IP"""
+        if '/' not in key:
+            return None
+        return ipaddress.ip_network(key, strict=False)
+
+    def load(self, rows: Iterable[Tuple[str, object, bool]], confirmed: Dict[str, tuple] = None):
+        """Загрузка блокировок из строк (ip_address, expires_at, is_permanent);
+        confirmed - локальные изменения, записанные в БД до чтения строк (см. _confirmed_local)"""
+        confirmed = confirmed or {}
+        entries = {}
+        now = time.time()
+        for ip, expires_at, is_permanent in rows:
+            expires = None if is_permanent else self.to_epoch(expires_at)
+            if expires is None and not is_permanent:
+                continue
+            if expires is None or expires > now:
+                entries[ip] = expires
+
+        with self._lock:
+            # Локальные изменения, которых еще нет в БД, поверх прочитанного. Записанные до чтения
+            # строк больше не нужны: дальше действует БД (например, разблокировка с другого воркера)
+            self._prune_local()
+            for ip, change in list(self._local.items()):
+                if confirmed.get(ip) is change:
+                    del self._local[ip]
+                elif change[0] is _REMOVED:
+                    entries.pop(ip, None)
+                else:
+                    entries[ip] = change[0]
+
+            prefixes = PrefixIndex()
+            for ip in entries:
+                network = self._network(ip)
+                if network is not None:
+                    prefixes.add(network, ip)
+            self._entries = entries
+            self._prefixes = prefixes
+
+    def _confirmed_local(self) -> Dict[str, tuple]:
+        """Локальные изменения, которые уже записаны в БД"""
+        with self._lock:
+            return {ip: change for ip, change in self._local.items()
+                    if change[2] is None or change[2].is_set()}
+
+    def _prune_local(self) -> int:
+        """Удаление локальных изменений старше local_grace (вызывается под self._lock)"""
+        cutoff = time.monotonic() - self.local_grace
+        expired = [ip for ip, (_, changed_at, _) in self._local.items() if changed_at <= cutoff]
+        for ip in expired:
+            del self._local[ip]
+        return len(expired)
+
+    def add(self, ip: str, expires_at: Optional[float] = None, written: threading.Event = None):
+        """Добавление блокировки (expires_at - epoch, None - бессрочно; written - см. self._local)"""
+        network = self._network(ip)
+        with self._lock:
+            self._entries[ip] = expires_at
+            if network is not None:
+                self._prefixes.add(network, ip)
+            if self._track_local:
+                self._local[ip] = (expires_at, time.monotonic(), written)
+
+    def discard(self, ip: str, written: threading.Event = None):
+        """Снятие блокировки"""
+        network = self._network(ip)
+        with self._lock:
+            self._entries.pop(ip, None)
+            if network is not None:
+                self._prefixes.remove(network)
+            if self._track_local:
+                self._local[ip] = (_REMOVED, time.monotonic(), written)
+
+    def __contains__(self, ip: str) -> bool:
+        """Проверка блокировки; истекшие записи удаляются при обращении"""
+        # Один ключ для точного поиска и поиска по подсетям (тот же, под которым блокирует middleware)
+        ip = self.client_address(ip)
+        expires = self._entries.get(ip, False)
+        if expires is not False:
+            if expires is None or expires > time.time():
+                return True
+            self.discard(ip)
+
+        self._maybe_sweep()
+        if self._prefixes:
+            return self._in_prefixes(ip)
+        return False
+
+    def _in_prefixes(self, ip: str) -> bool:
+        """Поиск IP (ключ client_address) в заблокированных подсетях"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+
+        now = time.time()
+        for key in self._prefixes.iter_matches(address):
+            expires = self._entries.get(key, False)
+            if expires is None or (expires is not False and expires > now):
+                return True
+        return False
+
+    def _maybe_sweep(self):
+        """Периодическая очистка истекших записей, которые никто не запрашивает"""
+        self._operations += 1
+        if self._operations >= self._sweep_every:
+            self._operations = 0
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Удаление всех истекших блокировок, возвращает их количество"""
+        now = time.time()
+        with self._lock:
+            expired = [ip for ip, expires in self._entries.items()
+                       if expires is not None and expires <= now]
+            for ip in expired:
+                del self._entries[ip]
+                network = self._network(ip)
+                if network is not None:
+                    self._prefixes.remove(network)
+        return len(expired)
+
+    def __len__(self) -> int:
+        """Количество действующих блокировок"""
+        self.sweep()
+        return len(self._entries)
+
+    def __iter__(self):
+        self.sweep()
+        return iter(list(self._entries))
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Копия индекса {ip: expires_at}"""
+        self.sweep()
+        with self._lock:
+            return dict(self._entries)
+
+    # ------------------------------------------------------------------
+    # Фоновое перечитывание блокировок (изменения с других воркеров)
+    # ------------------------------------------------------------------
+
+    def start_refresh(self, version: Callable[[], object], fetch_rows: Callable[[], Iterable], interval: float):
+        """Поток, который раз в interval секунд сверяет версию и перечитывает строки при ее изменении
+        (повторный вызов безопасен, после fork поток запускается заново)"""
+        pid = os.getpid()
+        if self._refresh_pid == pid and self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        self._refresh_pid = pid
+        self._track_local = True
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, args=(version, fetch_rows, interval),
+                                                name='blocklist-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def stop_refresh(self):
+        self._refresh_stop.set()
+
+    def _refresh_loop(self, version: Callable[[], object], fetch_rows: Callable[[], Iterable], interval: float):
+        # Первая проверка перечитывает БД: изменения между загрузкой при старте и запуском потока
+        seen = None
+        while not self._refresh_stop.wait(interval):
+            self.refresh_stats['checks'] += 1
+            try:
+                with self._lock:
+                    pruned = self._prune_local()
+                if pruned:
+                    # Изменения, так и не записанные в БД, больше не накладываются: индекс заново из БД
+                    seen = None
+                # Версия и записанные изменения читаются до строк: изменение между запросами
+                # даст еще одну перезагрузку
+                current = version()
+                if current != seen:
+                    confirmed = self._confirmed_local()
+                    self.load(fetch_rows(), confirmed)
+                    seen = current
+                    self.refresh_stats['reloads'] += 1
+            except Exception as e:
+                self.refresh_stats['errors'] += 1
+                security_events.emit('blocklist_refresh_error', f"❌ Ошибка обновления блокировок IP: {e}",
+                                     level='error', sample_key=(type(e).__name__,), error=str(e))
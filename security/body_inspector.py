@@ -0,0 +1,108 @@
+"""
+📨 ПОТОКОВАЯ ПРОВЕРКА ТЕЛА ЗАПРОСА
+CyberGuardian - Чтение тела по частям с перекрытием окон и ограничением объема
+"""
+
+import codecs
+import io
+import os
+from typing import Iterator, List
+from urllib.parse import unquote_plus
+
+
+class PrefixedStream(io.RawIOBase):
+    """📨 Поток: сначала уже прочитанные байты, затем остаток исходного потока"""
+
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = io.BytesIO(prefix)
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._prefix.read(size)
+        if size is None or size < 0:
+            return data + self._stream.read()
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        line = self._prefix.readline(size)
+        if line.endswith(b'\n') or (size is not None and 0 <= size <= len(line)):
+            return line
+        remaining = -1 if size is None or size < 0 else size - len(line)
+        return line + self._stream.readline(remaining)
+
+
+class RecordingStream:
+    """📼 Обертка потока, запоминающая прочитанные байты"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._consumed = io.BytesIO()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._consumed.write(data)
+        return data
+
+    def getvalue(self) -> bytes:
+        return self._consumed.getvalue()
+
+
+class StreamingBodyInspector:
+    """📨 Разбиение тела запроса на окна текста для сигнатурной проверки"""
+
+    def __init__(self, chunk_size: int = 64 * 1024, overlap: int = 1024, max_bytes: int = None):
+        self.chunk_size = chunk_size
+        # Хвост предыдущего окна повторяется в начале следующего,
+        # чтобы не пропустить сигнатуру на стыке частей
+        self.overlap = overlap
+        self.max_bytes = max_bytes or int(os.getenv('SECURITY_MAX_INSPECT_BYTES', 1024 * 1024))
+
+    def iter_windows(self, stream, url_encoded: bool = False) -> Iterator[str]:
+        """Окна текста тела (не более max_bytes прочитанных байт)"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        tail = ''
+        remaining = self.max_bytes
+
+        while remaining > 0:
+            chunk = stream.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+            # Декодируем один раз; инкрементальный декодер склеивает
+            # многобайтовые символы, разрезанные границей части
+            text = decoder.decode(chunk)
+            window = tail + text
+            yield unquote_plus(window) if url_encoded else window
+            tail = window[-self.overlap:]
+
+        text = decoder.decode(b'', final=True)
+        if text:
+            window = tail + text
+            yield unquote_plus(window) if url_encoded else window
+
+    def inspect_request(self, request) -> List[str]:
+        """Окна тела Flask-запроса; поток остается доступным обработчикам"""
+        url_encoded = request.mimetype == 'application/x-www-form-urlencoded'
+
+        cached_data = getattr(request, '_cached_data', None)
+        if cached_data is not None:
+            return list(self.iter_windows(io.BytesIO(cached_data), url_encoded))
+
+        stream = request.stream
+        recorder = RecordingStream(stream)
+        try:
+            return list(self.iter_windows(recorder, url_encoded))
+        finally:
+            # Обработчики прочитают тело с начала: прочитанное + непрочитанный остаток
+            request.__dict__['stream'] = io.BufferedReader(PrefixedStream(recorder.getvalue(), stream))
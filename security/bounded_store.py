@@ -0,0 +1,97 @@
+"""
+📦 ОГРАНИЧЕННОЕ ХРАНИЛИЩЕ СОСТОЯНИЯ ПО IP
+CyberGuardian - LRU + TTL вместо бесконечно растущих defaultdict
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class BoundedStore:
+    """📦 Словарь с ограничением числа ключей (LRU) и временем жизни (TTL)"""
+
+    def __init__(self, max_keys: int = 100000, ttl_seconds: Optional[float] = 3600,
+                 default_factory: Optional[Callable[[], Any]] = None):
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.default_factory = default_factory
+        self._data = OrderedDict()  # {key: [value, last_access]}, от давних к недавним
+        self._lock = threading.Lock()
+        self.stats = {'evicted_lru': 0, 'expired_ttl': 0}
+
+    def _is_expired(self, last_access: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _evict(self, now: float):
+        """Удаление истекших ключей с начала и лишних сверх max_keys (под блокировкой)"""
+        data = self._data
+        while data:
+            key, (_, last_access) = next(iter(data.items()))
+            if not self._is_expired(last_access, now):
+                break
+            del data[key]
+            self.stats['expired_ttl'] += 1
+
+        while len(data) > self.max_keys:
+            data.popitem(last=False)
+            self.stats['evicted_lru'] += 1
+
+    def __getitem__(self, key):
+        """Значение по ключу; при отсутствии создается через default_factory"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._is_expired(entry[1], now):
+                entry[1] = now
+                self._data.move_to_end(key)
+                return entry[0]
+
+            if self.default_factory is None:
+                raise KeyError(key)
+            value = self.default_factory()
+            self._data[key] = [value, now]
+            self._data.move_to_end(key)
+            self._evict(now)
+            return value
+
+    def __setitem__(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._data[key] = [value, now]
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def get(self, key, default=None):
+        """Значение без создания записи и без продления TTL"""
+        entry = self._data.get(key)
+        if entry is None or self._is_expired(entry[1], time.time()):
+            return default
+        return entry[0]
+
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and not self._is_expired(entry[1], time.time())
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def sweep(self):
+        """Принудительное удаление истекших ключей"""
+        with self._lock:
+            self._evict(time.time())
+
+    def get_stats(self) -> Dict:
+        """Размер и счетчики вытеснения"""
+        return {
+            'keys': len(self._data),
+            'max_keys': self.max_keys,
+            'ttl_seconds': self.ttl_seconds,
+            **self.stats
+        }
@@ -20,12 +20,14 @@ from datetime import datetime
 from flask import request, session, g
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from security.event_log import security_events
+
 class DataEncryption:
     """🔒 Шифрование конфиденциальных данных"""
     
-    def __init__(self, master_key: str = None):
+    def __init__(self, master_key: str = None, key_salt: str = None):
         self.master_key = master_key or os.getenv('ENCRYPTION_MASTER_KEY', self._generate_master_key())
-        self.key_salt = os.getenv('ENCRYPTION_SALT', base64.urlsafe_b64encode(os.urandom(16)).decode())
+        self.key_salt = key_salt or os.getenv('ENCRYPTION_SALT', base64.urlsafe_b64encode(os.urandom(16)).decode())
         self._setup_encryption()
     
     def _generate_master_key(self) -> str:
@@ -48,7 +50,7 @@ class DataEncryption:
             self.fernet = Fernet(key)
             
         except Exception as e:
-            print(f"❌ Ошибка настройки шифрования: {e}")
+            security_events.emit('encryption_setup_error', f"❌ Ошибка настройки шифрования: {e}", level='error', error=str(e))
             self.fernet = None
     
     def encrypt_data(self, data: str) -> Optional[str]:
@@ -60,7 +62,8 @@ class DataEncryption:
             encrypted_data = self.fernet.encrypt(data.encode())
             return base64.urlsafe_b64encode(encrypted_data).decode()
         except Exception as e:
-            print(f"❌ Ошибка шифрования: {e}")
+            security_events.emit('encryption_error', f"❌ Ошибка шифрования: {e}", level='error',
+                                 sample_key=(type(e).__name__,), error=str(e))
             return None
     
     def decrypt_data(self, encrypted_data: str) -> Optional[str]:
@@ -73,10 +76,12 @@ class DataEncryption:
             decrypted_data = self.fernet.decrypt(encrypted_bytes)
             return decrypted_data.decode()
         except InvalidToken:
-            print("❌ Недействительный токен для расшифровки")
+            security_events.emit('decryption_invalid_token', "❌ Недействительный токен для расшифровки", level='warning',
+                                 sample_key=())
             return None
         except Exception as e:
-            print(f"❌ Ошибка расшифровки: {e}")
+            security_events.emit('decryption_error', f"❌ Ошибка расшифровки: {e}", level='error',
+                                 sample_key=(type(e).__name__,), error=str(e))
             return None
     
     def hash_sensitive_data(self, data: str, salt: str = None) -> str:
@@ -340,7 +345,7 @@ class DatabaseProtection:
             conn.close()
             
         except Exception as e:
-            print(f"❌ Ошибка настройки защиты БД: {e}")
+            security_events.emit('database_security_error', f"❌ Ошибка настройки защиты БД: {e}", level='error', error=str(e))
     
     def create_secure_table(self, table_name: str, columns: Dict[str, str]):
         """Создание защищенной таблицы"""
@@ -357,7 +362,8 @@ class DatabaseProtection:
             conn.close()
             
         except Exception as e:
-            print(f"❌ Ошибка создания таблицы {table_name}: {e}")
+            security_events.emit('secure_table_error', f"❌ Ошибка создания таблицы {table_name}: {e}", level='error',
+                                 table=table_name, error=str(e))
     
     def encrypt_sensitive_column(self, table_name: str, column_name: str):
         """Шифрование чувствительного столбца"""
@@ -375,7 +381,8 @@ class DatabaseProtection:
             conn.close()
             
         except Exception as e:
-            print(f"❌ Ошибка шифрования столбца {column_name}: {e}")
+            security_events.emit('column_encryption_error', f"❌ Ошибка шифрования столбца {column_name}: {e}", level='error',
+                                 table=table_name, column=column_name, error=str(e))
 
 # Создаем глобальные экземпляры
 data_encryption = DataEncryption()
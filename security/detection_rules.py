@@ -0,0 +1,147 @@
+"""
+📜 ПРАВИЛА ОБНАРУЖЕНИЯ УГРОЗ
+CyberGuardian - Сигнатуры атак и классы запросов (без состояния, без обращения к БД)
+"""
+
+from typing import Optional
+from urllib.parse import unquote_plus
+
+# Сигнатуры атак по категориям
+THREAT_PATTERNS = {
+    'sql_injection': [
+        r"(\bunion\b.*\bselect\b)",
+        r"(\bor\b\s+\d+\s*=\s*\d+)",
+        r"(\bdrop\b.*\btable\b)",
+        r"(\bdelete\b.*\bfrom\b)",
+        r"(\binsert\b.*\binto\b)",
+        r"(\bupdate\b.*\bset\b)",
+        r"(\bexec\b|\bexecute\b)",
+        r"(';\s*--)|(;\s*--)",
+        r"(\bor\b\s*'.*'='.*')",
+        r"(\bxp_cmdshell\b)",
+        r"(\binformation_schema\b)",
+        r"(\bsys\.tables\b)",
+        r"(\bload_file\b\()",
+        r"(\binto\s+outfile\b)"
+    ],
+    'xss_attempts': [
+        r"<script[^>]*>.*?</script>",
+        r"javascript:",
+        r"vbscript:",
+        r"onload\s*=",
+        r"onerror\s*=",
+        r"onclick\s*=",
+        r"<iframe[^>]*>",
+        r"<object[^>]*>",
+        r"<embed[^>]*>",
+        r"<form[^>]*action\s*=\s*['\"].*['\"]",
+        r"document\.cookie",
+        r"document\.location",
+        r"eval\(",
+        r"alert\(",
+        r"confirm\(",
+        r"prompt\("
+    ],
+    'path_traversal': [
+        r"\.\./",
+        r"\.\.\\",
+        r"%2e%2e%2f",
+        r"%2e%2e%5c",
+        r"\.\.%2f",
+        r"\.\.%5c",
+        r"/etc/passwd",
+        r"c:\\windows\\system32",
+        r"boot\.ini",
+        r"\\..\\",
+        r"\.\.%252f"
+    ],
+    'command_injection': [
+        r"\|\s*nc\s",
+        r"\|\s*netcat\s",
+        r"\|\s*bash\s",
+        r"\|\s*sh\s",
+        r"\|\s*powershell\s",
+        r";\s*rm\s",
+        r";\s*del\s",
+        r"&\s*cmd",
+        r"&\s*command",
+        r"\|\|\s*whoami",
+        r"\|\|\s*id",
+        r"`[^`]*`",
+        r"\$\([^)]*\)",
+        r"\bcurl\s",
+        r"\bwget\s",
+        r"\bnslookup\s",
+        r"\bdig\s"
+    ],
+    'malicious_files': [
+        r"\.php$",
+        r"\.asp$",
+        r"\.aspx$",
+        r"\.jsp$",
+        r"\.exe$",
+        r"\.bat$",
+        r"\.cmd$",
+        r"\.scr$",
+        r"\.vbs$",
+        r"\.js$",
+        r"\.jar$",
+        r"\.com$",
+        r"\.pif$",
+        r"\.scr$"
+    ],
+    'suspicious_user_agents': [
+        r"sqlmap",
+        r"nikto",
+        r"nmap",
+        r"masscan",
+        r"zap",
+        r"burp",
+        r"scanner",
+        r"bot",
+        r"crawler",
+        r"spider",
+        r"wget",
+        r"curl",
+        r"python-requests",
+        r"scrapy"
+    ]
+}
+
+# Категории, при которых IP блокируется сразу
+CRITICAL_THREAT_TYPES = frozenset({'sql_injection', 'command_injection', 'path_traversal'})
+
+# Классы запросов для security_middleware (вычисляются один раз при импорте)
+STATIC_PATH_PREFIXES = ('/static/',)
+STATIC_PATHS = frozenset({'/favicon.ico', '/robots.txt', '/sitemap.xml'})
+MONITORING_PATHS = frozenset({'/health', '/api/ping', '/api/bot-friendly', '/api/health-deep', '/admin/metrics'})
+BODILESS_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+REQUEST_CLASSES = ('static', 'monitoring', 'url_only', 'full')
+
+# Категории, не применяемые к классу запроса:
+# - сигнатуры User-Agent к URL: иначе срабатывают наши же /scanner/...
+# - расширения файлов (якорь $) к строке запроса и декодированному телу: иначе срабатывает
+#   любое значение, заканчивающееся на ".com" (?email=ivan@mail.com), а в старом repr
+#   запроса они не срабатывали никогда
+SCAN_EXCLUDED_CATEGORIES = {
+    'url_only': frozenset({'suspicious_user_agents', 'malicious_files'}),
+    'full': frozenset({'malicious_files'}),
+}
+
+
+def classify_request(path: str, method: str, content_length: Optional[int]) -> str:
+    """Класс запроса: static, monitoring, url_only (без тела) или full"""
+    if path in STATIC_PATHS or path.startswith(STATIC_PATH_PREFIXES):
+        return 'static'
+    if path in MONITORING_PATHS:
+        return 'monitoring'
+    if method in BODILESS_METHODS and not content_length:
+        return 'url_only'
+    return 'full'
+
+
+def url_payload(path: str, query_string: str = '') -> str:
+    """Путь и строка запроса для проверки (как есть и в декодированном виде)"""
+    url = f"{path}?{query_string}" if query_string else path
+    decoded = unquote_plus(url)
+    return url if decoded == url else f"{url}\n{decoded}"
@@ -0,0 +1,146 @@
+"""
+📈 ЭСКАЛАЦИЯ АВТОМАТИЧЕСКИХ БЛОКИРОВОК
+CyberGuardian - Счетчик нарушений по IP, растущие сроки блокировки и tarpit на уровне WSGI
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+from security.bounded_store import BoundedStore
+
+# Базовый срок блокировки (часы) для первого нарушения каждого вида
+BASE_BLOCK_HOURS = {
+    'rate_limit': 1,
+    'critical': 24,
+}
+
+# Виды нарушений, которые ведут в tarpit: превышение лимита запросов дают и NAT, и активные AJAX-клиенты
+TARPIT_KINDS = frozenset({'critical'})
+
+
+class EscalationPolicy:
+    """📈 Нарушения по IP: срок блокировки = база * factor^(нарушение - 1), с потолком"""
+
+    def __init__(self, factor: float = None, max_hours: float = None, tarpit_strikes: int = None,
+                 strike_ttl_hours: float = None, max_keys: int = None, trusted_proxies: int = None):
+        self.factor = factor or float(os.getenv('SECURITY_ESCALATION_FACTOR', 2))
+        self.max_hours = max_hours or float(os.getenv('SECURITY_ESCALATION_MAX_HOURS', 720))
+        # С этого критического нарушения IP получает готовый 403 до Flask. По умолчанию 0 - tarpit
+        # отключен: security_middleware пока не блокирует, и включение блокировок - отдельное решение
+        self.tarpit_strikes = (tarpit_strikes if tarpit_strikes is not None
+                               else int(os.getenv('SECURITY_TARPIT_STRIKES', 0)))
+        # Число доверенных прокси перед приложением: без них X-Forwarded-For задает сам клиент
+        self.trusted_proxies = (trusted_proxies if trusted_proxies is not None
+                                else int(os.getenv('SECURITY_TRUSTED_PROXIES', 0)))
+        strike_ttl_hours = strike_ttl_hours or float(os.getenv('SECURITY_STRIKE_TTL_HOURS', 168))
+        max_keys = max_keys or int(os.getenv('SECURITY_MAX_TRACKED_IPS', 100000))
+
+        # {ip: {'strikes', 'last_strike', 'last_kind', 'last_hours'}}; забываются через strike_ttl без нарушений
+        self.strikes = BoundedStore(max_keys=max_keys, ttl_seconds=strike_ttl_hours * 3600)
+        # {ip: окончание блокировки (epoch)} - проверяется TarpitMiddleware
+        self.tarpit = BoundedStore(max_keys=max_keys, ttl_seconds=self.max_hours * 3600)
+        self.tarpit_hits = 0
+
+    def strike(self, ip: str, kind: str) -> Tuple[int, float, bool]:
+        """Новое нарушение: (номер нарушения, срок блокировки в часах, попал ли IP в tarpit)"""
+        now = time.time()
+        record = self.strikes.get(ip)
+        strikes = (record['strikes'] if record else 0) + 1
+
+        base = BASE_BLOCK_HOURS.get(kind, BASE_BLOCK_HOURS['critical'])
+        hours = min(base * self.factor ** (strikes - 1), self.max_hours)
+        self.strikes[ip] = {'strikes': strikes, 'last_strike': now, 'last_kind': kind, 'last_hours': hours}
+
+        tarpitted = bool(self.tarpit_strikes) and kind in TARPIT_KINDS and strikes >= self.tarpit_strikes
+        if tarpitted:
+            self.tarpit[ip] = now + hours * 3600
+        return strikes, hours, tarpitted
+
+    def client_ip(self, environ) -> str:
+        """Адрес клиента, которому можно доверять: REMOTE_ADDR или, за trusted_proxies прокси,
+        адрес из X-Forwarded-For, добавленный самым дальним из них (как x_for в ProxyFix)"""
+        if self.trusted_proxies:
+            hops = [hop.strip() for hop in environ.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+            if len(hops) >= self.trusted_proxies:
+                return hops[-self.trusted_proxies]
+        return environ.get('REMOTE_ADDR', '')
+
+    def is_tarpitted(self, ip: str) -> bool:
+        """IP в tarpit и срок его блокировки не истек"""
+        expires = self.tarpit.get(ip)
+        if expires is None:
+            return False
+        if expires > time.time():
+            return True
+        self.tarpit.pop(ip)
+        return False
+
+    def forgive(self, ip: str):
+        """Снятие блокировки вручную: сброс нарушений и выход из tarpit"""
+        self.strikes.pop(ip)
+        self.tarpit.pop(ip)
+
+    def export_state(self, limit: int = 1000) -> Dict:
+        """Снимок состояния для просмотра: настройки, нарушители с наибольшим числом нарушений, tarpit"""
+        now = time.time()
+        offenders = sorted(
+            ((ip, record) for ip, (record, _) in list(self.strikes._data.items())),
+            key=lambda item: item[1]['strikes'], reverse=True
+        )[:limit]
+        tarpit = [(ip, expires) for ip, (expires, _) in list(self.tarpit._data.items()) if expires > now][:limit]
+
+        def iso(epoch: float) -> str:
+            return datetime.fromtimestamp(epoch).isoformat(timespec='seconds')
+
+        return {
+            'config': {
+                'factor': self.factor,
+                'max_hours': self.max_hours,
+                'tarpit_strikes': self.tarpit_strikes,
+                'tarpit_kinds': sorted(TARPIT_KINDS),
+                'trusted_proxies': self.trusted_proxies,
+                'base_hours': BASE_BLOCK_HOURS,
+                'strike_ttl_hours': self.strikes.ttl_seconds / 3600
+            },
+            'offenders': {
+                ip: {**record, 'last_strike': iso(record['last_strike'])} for ip, record in offenders
+            },
+            'tarpit': {ip: iso(expires) for ip, expires in tarpit},
+            'stats': self.get_stats()
+        }
+
+    def get_stats(self) -> Dict:
+        return {
+            'tracked_ips': len(self.strikes),
+            'tarpit_ips': len(self.tarpit),
+            'tarpit_hits': self.tarpit_hits,
+            'evicted_lru': self.strikes.stats['evicted_lru'] + self.tarpit.stats['evicted_lru']
+        }
+
+
+class TarpitMiddleware:
+    """🕳️ WSGI-обертка: IP из tarpit получают готовый 403 без маршрутизации, сессии и шаблонов"""
+
+    BODY = b'Forbidden\n'
+    HEADERS = [
+        ('Content-Type', 'text/plain; charset=utf-8'),
+        ('Content-Length', str(len(BODY))),
+        ('Cache-Control', 'no-store'),
+        ('Connection', 'close'),
+    ]
+
+    def __init__(self, wsgi_app, policy: EscalationPolicy):
+        self.wsgi_app = wsgi_app
+        self.policy = policy
+
+    def __call__(self, environ, start_response):
+        # Тот же ключ, что и у нарушений в escalate_block: подставной X-Forwarded-For не отправит
+        # в tarpit чужой адрес
+        if self.policy.tarpit and self.policy.is_tarpitted(self.policy.client_ip(environ)):
+            self.policy.tarpit_hits += 1
+            start_response('403 FORBIDDEN', list(self.HEADERS))
+            return [self.BODY]
+        return self.wsgi_app(environ, start_response)
+
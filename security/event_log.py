@@ -0,0 +1,195 @@
+"""
+📝 ЖУРНАЛ СОБЫТИЙ БЕЗОПАСНОСТИ
+CyberGuardian - Структурированные события в JSON lines: очередь, пакетная запись, ротация файла
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+
+class SecurityEventLog:
+    """📝 События безопасности: поток запроса только кладет запись в очередь"""
+
+    def __init__(self, path: str = None, max_bytes: int = None, backup_count: int = None,
+                 sample_seconds: float = None, batch_size: int = 500, flush_interval_ms: int = 200,
+                 console: bool = None, max_sample_keys: int = 10000):
+        self.path = path or os.getenv('SECURITY_EVENT_LOG_PATH', 'instance/security_events.jsonl')
+        self.max_bytes = max_bytes or int(os.getenv('SECURITY_EVENT_LOG_MAX_BYTES', 10 * 1024 * 1024))
+        self.backup_count = backup_count if backup_count is not None else int(os.getenv('SECURITY_EVENT_LOG_BACKUPS', 5))
+        # Повторы с тем же ключом (IP + тип угрозы и т.п.) внутри окна не пишутся, а считаются
+        self.sample_seconds = (sample_seconds if sample_seconds is not None
+                               else float(os.getenv('SECURITY_EVENT_SAMPLE_SECONDS', 1)))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        # Дублирование сообщений в stdout (из потока писателя, не из потока запроса)
+        self.console = console if console is not None else os.getenv('SECURITY_EVENT_LOG_CONSOLE', '0') == '1'
+        self.max_sample_keys = max_sample_keys
+
+        self._sampled = {}  # {ключ: [время последней записи, подавлено с тех пор]}
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+        self.metrics = {'emitted': 0, 'suppressed': 0, 'written': 0, 'batches': 0, 'write_errors': 0}
+        atexit.register(self.close)
+
+    def _ensure_process(self):
+        """Очередь и поток писателя создаются в каждом процессе (после fork воркеров)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            # Счетчики родителя относятся к его очереди
+            self.metrics = dict.fromkeys(self.metrics, 0)
+            self._writer = threading.Thread(target=self._writer_loop, name='security-event-log', daemon=True)
+            self._pid = os.getpid()
+            self._writer.start()
+
+    def emit(self, event: str, message: str, level: str = 'info',
+             sample_key: Optional[Tuple] = None, **fields) -> bool:
+        """Событие в очередь; False, если оно подавлено выборкой"""
+        now = time.time()
+
+        if sample_key is not None and self.sample_seconds > 0:
+            # Без блокировки: операции со словарем атомарны под GIL,
+            # потерянный инкремент счетчика подавленных допустим
+            key = (event, *sample_key)
+            entry = self._sampled.get(key)
+            if entry is not None and now - entry[0] < self.sample_seconds:
+                entry[1] += 1
+                self.metrics['suppressed'] += 1
+                return False
+            if entry is not None and entry[1]:
+                # Число подавленных повторов попадает в следующее записанное событие
+                fields['suppressed'] = entry[1]
+            if len(self._sampled) >= self.max_sample_keys:
+                self._sampled = {}
+            self._sampled[key] = [now, 0]
+
+        self._ensure_process()
+        self._queue.put((now, level, event, message, fields))
+        self.metrics['emitted'] += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # Поток писателя
+    # ------------------------------------------------------------------
+
+    def _format(self, item) -> str:
+        timestamp, level, event, message, fields = item
+        record = {
+            'ts': datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': level,
+            'event': event,
+            'message': message,
+            'pid': self._pid,
+            **fields
+        }
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+    def _writer_loop(self):
+        handler = None
+        log_queue = self._queue
+
+        while True:
+            batch = []
+            stop = False
+
+            item = log_queue.get()
+            if item is None:
+                stop = True
+            else:
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = log_queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+
+            if batch:
+                if handler is None:
+                    handler = self._open_handler()
+                self._write_batch(handler, batch)
+
+            if stop:
+                if handler is not None:
+                    handler.close()
+                return
+
+    def _open_handler(self) -> RotatingFileHandler:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                   encoding='utf-8', delay=True)
+
+    def _write_batch(self, handler: RotatingFileHandler, batch):
+        """Одна запись и один flush на пакет"""
+        try:
+            data = ''.join(self._format(item) + '\n' for item in batch)
+            if handler.stream is None:
+                handler.stream = handler._open()
+            if handler.maxBytes and handler.stream.tell() + len(data) >= handler.maxBytes:
+                handler.doRollover()
+                if handler.stream is None:
+                    handler.stream = handler._open()
+            handler.stream.write(data)
+            handler.stream.flush()
+            self.metrics['written'] += len(batch)
+            self.metrics['batches'] += 1
+        except Exception as e:
+            self.metrics['write_errors'] += len(batch)
+            sys.stderr.write(f"❌ Ошибка записи журнала событий безопасности: {e}\n")
+
+        if self.console:
+            sys.stdout.write(''.join(f"{message}\n" for _, _, _, message, _ in batch))
+            sys.stdout.flush()
+
+    def flush(self, timeout: float = 5):
+        """Ожидание записи уже поставленных событий (для тестов и завершения)"""
+        if self._pid != os.getpid() or self._queue is None:
+            return
+        deadline = time.monotonic() + timeout
+        metrics = self.metrics
+        while (metrics['written'] + metrics['write_errors'] < metrics['emitted']
+               and time.monotonic() < deadline):
+            time.sleep(0.01)
+
+    def close(self):
+        """Сброс очереди при завершении процесса"""
+        if self._pid != os.getpid() or self._writer is None or not self._writer.is_alive():
+            return
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.metrics,
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'path': self.path,
+            'sample_seconds': self.sample_seconds,
+            'sample_keys': len(self._sampled)
+        }
+
+
+# Глобальный журнал событий безопасности
+security_events = SecurityEventLog()
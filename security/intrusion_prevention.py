@@ -6,138 +6,84 @@ CyberGuardian - Максимальная защита от кибератак
 import re
 import time
 import hashlib
-import json
-import sqlite3
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-from flask import request, g, abort, jsonify
-from collections import defaultdict, deque
 import threading
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from flask import request, g, abort, jsonify, has_request_context
+
+from security.pattern_engine import ThreatPatternEngine
+from security.literal_prefilter import fold_case
+from security.threat_store import ThreatStore
+from security.blocklist import BlocklistIndex
+from security.rate_limit_backends import MemoryRateLimitBackend, SlidingWindowCounter
+from security.bounded_store import BoundedStore
+from security.body_inspector import StreamingBodyInspector
+from security.log_retention import LogRetention
+from security.stage_metrics import stage_metrics
+from security.event_log import security_events
+from security.escalation import EscalationPolicy
+from security.detection_rules import (
+    THREAT_PATTERNS, CRITICAL_THREAT_TYPES, REQUEST_CLASSES, SCAN_EXCLUDED_CATEGORIES,
+    classify_request, url_payload
+)
 
 class SecurityThreatDetector:
     """🛡️ Основной класс для обнаружения угроз"""
     
     def __init__(self):
-        self.threat_patterns = {
-            'sql_injection': [
-                r"(\bunion\b.*\bselect\b)",
-                r"(\bor\b\s+\d+\s*=\s*\d+)",
-                r"(\bdrop\b.*\btable\b)",
-                r"(\bdelete\b.*\bfrom\b)",
-                r"(\binsert\b.*\binto\b)",
-                r"(\bupdate\b.*\bset\b)",
-                r"(\bexec\b|\bexecute\b)",
-                r"(';\s*--)|(;\s*--)",
-                r"(\bor\b\s*'.*'='.*')",
-                r"(\bxp_cmdshell\b)",
-                r"(\binformation_schema\b)",
-                r"(\bsys\.tables\b)",
-                r"(\bload_file\b\()",
-                r"(\binto\s+outfile\b)"
-            ],
-            'xss_attempts': [
-                r"<script[^>]*>.*?</script>",
-                r"javascript:",
-                r"vbscript:",
-                r"onload\s*=",
-                r"onerror\s*=",
-                r"onclick\s*=",
-                r"<iframe[^>]*>",
-                r"<object[^>]*>",
-                r"<embed[^>]*>",
-                r"<form[^>]*action\s*=\s*['\"].*['\"]",
-                r"document\.cookie",
-                r"document\.location",
-                r"eval\(",
-                r"alert\(",
-                r"confirm\(",
-                r"prompt\("
-            ],
-            'path_traversal': [
-                r"\.\./",
-                r"\.\.\\",
-                r"%2e%2e%2f",
-                r"%2e%2e%5c",
-                r"\.\.%2f",
-                r"\.\.%5c",
-                r"/etc/passwd",
-                r"c:\\windows\\system32",
-                r"boot\.ini",
-                r"\\..\\",
-                r"\.\.%252f"
-            ],
-            'command_injection': [
-                r"\|\s*nc\s",
-                r"\|\s*netcat\s",
-                r"\|\s*bash\s",
-                r"\|\s*sh\s",
-                r"\|\s*powershell\s",
-                r";\s*rm\s",
-                r";\s*del\s",
-                r"&\s*cmd",
-                r"&\s*command",
-                r"\|\|\s*whoami",
-                r"\|\|\s*id",
-                r"`[^`]*`",
-                r"\$\([^)]*\)",
-                r"\bcurl\s",
-                r"\bwget\s",
-                r"\bnslookup\s",
-                r"\bdig\s"
-            ],
-            'malicious_files': [
-                r"\.php$",
-                r"\.asp$",
-                r"\.aspx$",
-                r"\.jsp$",
-                r"\.exe$",
-                r"\.bat$",
-                r"\.cmd$",
-                r"\.scr$",
-                r"\.vbs$",
-                r"\.js$",
-                r"\.jar$",
-                r"\.com$",
-                r"\.pif$",
-                r"\.scr$"
-            ],
-            'suspicious_user_agents': [
-                r"sqlmap",
-                r"nikto",
-                r"nmap",
-                r"masscan",
-                r"zap",
-                r"burp",
-                r"scanner",
-                r"bot",
-                r"crawler",
-                r"spider",
-                r"wget",
-                r"curl",
-                r"python-requests",
-                r"scrapy"
-            ]
-        }
+        # Копия сигнатур: изменения в экземпляре не затрагивают общие правила
+        self.threat_patterns = {threat_type: list(patterns) for threat_type, patterns in THREAT_PATTERNS.items()}
         
-        # Блокированные IP адреса
-        self.blocked_ips = set()
-        self.ip_activity = defaultdict(lambda: {'requests': deque(maxlen=100), 'threats': 0, 'last_activity': time.time()})
-        self.rate_limits = defaultdict(lambda: {'count': 0, 'reset_time': time.time()})
+        # Все паттерны компилируются один раз при старте
+        self.pattern_engine = ThreatPatternEngine(self.threat_patterns)
+        
+        # Блокированные IP адреса (индекс в памяти со сроками действия)
+        self.blocked_ips = BlocklistIndex()
+        # Активность по IP: не больше SECURITY_MAX_TRACKED_IPS адресов, простаивающие - через час
+        self.ip_activity = BoundedStore(
+            max_keys=int(os.getenv('SECURITY_MAX_TRACKED_IPS', 100000)),
+            ttl_seconds=3600,
+            default_factory=lambda: {
+                # Запросы за последнюю минуту: 12 корзин по 5 секунд вместо списка меток времени
+                'requests': SlidingWindowCounter(60, 12),
+                'threats': 0,
+                'last_activity': time.time()
+            }
+        )
+        # Классификация User-Agent: {UA: число сработавших сигнатур}, повторные UA без регулярок
+        self.user_agent_regexes = [re.compile(pattern) for pattern in self.threat_patterns['suspicious_user_agents']]
+        self.user_agent_cache = BoundedStore(
+            max_keys=int(os.getenv('SECURITY_UA_CACHE_SIZE', 4096)),
+            ttl_seconds=None
+        )
+        # Счетчики запросов (память процесса или общее хранилище воркеров)
+        self.rate_limit_backend = MemoryRateLimitBackend()
+        # Кэш результатов проверки сигнатур: {дайджест запроса: совпадения}, 0 - отключен
+        self.verdict_cache = BoundedStore(
+            max_keys=int(os.getenv('SECURITY_VERDICT_CACHE_SIZE', 10000)),
+            ttl_seconds=None
+        )
+        self.verdict_cache_stats = {'hits': 0, 'threat_hits': 0, 'misses': 0}
+        
+        # Постоянное соединение с БД угроз и фоновая запись журнала
+        self.store = ThreatStore('instance/threats.db')
+        # Ротация и архивация security_logs (поток запускается из create_app)
+        self.retention = LogRetention(self.store.db_path)
+        # Нарушения по IP: растущие сроки автоматических блокировок и tarpit для повторных нарушителей
+        self.escalation = EscalationPolicy()
+        
+        # Счетчики запросов по классам security_middleware
+        self.request_class_counts = dict.fromkeys(REQUEST_CLASSES, 0)
         
         # Инициализация базы данных угроз
         self.init_threat_database()
+        self.load_blocked_ips()
     
     def init_threat_database(self):
         """Инициализация базы данных для хранения угроз"""
         try:
-            threat_db_path = 'instance/threats.db'
-            os.makedirs('instance', exist_ok=True)
-            
-            conn = sqlite3.connect(threat_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+            self.store.executescript('''
                 CREATE TABLE IF NOT EXISTS security_logs (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -149,38 +95,91 @@ class SecurityThreatDetector:
                     request_method TEXT,
                     severity TEXT,
                     blocked BOOLEAN DEFAULT 0
-                )
-            ''')
-            
-            cursor.execute('''
+                );
+                
                 CREATE TABLE IF NOT EXISTS blocked_ips (
                     ip_address TEXT PRIMARY KEY,
                     blocked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     reason TEXT,
                     expires_at DATETIME,
                     is_permanent BOOLEAN DEFAULT 0
-                )
+                );
+                
+                -- Поминутные агрегаты журнала, их ведет писатель ThreatStore
+                CREATE TABLE IF NOT EXISTS security_rollup_threat_minute (
+                    minute TEXT NOT NULL,
+                    threat_type TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (minute, threat_type)
+                );
+                
+                CREATE TABLE IF NOT EXISTS security_rollup_ip_minute (
+                    minute TEXT NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (minute, ip_address)
+                );
+                
+                CREATE TABLE IF NOT EXISTS security_rollup_meta (
+                    name TEXT PRIMARY KEY,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE INDEX IF NOT EXISTS idx_security_logs_timestamp ON security_logs (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_security_logs_ip ON security_logs (ip_address, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_blocked_ips_expires ON blocked_ips (expires_at);
+                
+                -- Счетчик изменений blocked_ips: воркеры перечитывают блокировки, только когда он меняется
+                CREATE TABLE IF NOT EXISTS security_blocklist_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO security_blocklist_version (id, version) VALUES (1, 0);
+                
+                CREATE TRIGGER IF NOT EXISTS trg_blocked_ips_insert AFTER INSERT ON blocked_ips
+                BEGIN UPDATE security_blocklist_version SET version = version + 1 WHERE id = 1; END;
+                CREATE TRIGGER IF NOT EXISTS trg_blocked_ips_update AFTER UPDATE ON blocked_ips
+                BEGIN UPDATE security_blocklist_version SET version = version + 1 WHERE id = 1; END;
+                CREATE TRIGGER IF NOT EXISTS trg_blocked_ips_delete AFTER DELETE ON blocked_ips
+                BEGIN UPDATE security_blocklist_version SET version = version + 1 WHERE id = 1; END;
             ''')
             
-            conn.commit()
-            conn.close()
-            print("🛡️ База данных угроз инициализирована")
+            # Агрегаты за последние сутки для БД, созданной до появления агрегатов
+            self.store.backfill_rollups()
+            security_events.emit('threat_db_ready', "🛡️ База данных угроз инициализирована")
             
         except Exception as e:
-            print(f"❌ Ошибка инициализации БД угроз: {e}")
+            security_events.emit('threat_db_error', f"❌ Ошибка инициализации БД угроз: {e}", level='error', error=str(e))
+    
+    def fetch_blocked_ips(self) -> List[tuple]:
+        """Строки blocked_ips для BlocklistIndex.load"""
+        return self.store.fetchall('SELECT ip_address, expires_at, is_permanent FROM blocked_ips')
+    
+    def blocked_ips_version(self) -> int:
+        """Счетчик изменений blocked_ips (ведут триггеры БД)"""
+        return self.store.fetchone('SELECT version FROM security_blocklist_version WHERE id = 1')[0]
+    
+    def load_blocked_ips(self):
+        """Загрузка действующих блокировок из БД в индекс при старте"""
+        try:
+            rows = self.fetch_blocked_ips()
+            self.blocked_ips.load(rows)
+            security_events.emit('blocklist_loaded', f"🚫 Загружено блокировок IP: {len(self.blocked_ips)}",
+                                 count=len(self.blocked_ips))
+        except Exception as e:
+            security_events.emit('blocklist_error', f"❌ Ошибка загрузки блокировок IP: {e}", level='error', error=str(e))
+    
+    def start_blocklist_refresh(self, interval: float):
+        """Фоновая сверка blocked_ips раз в interval секунд: блокировки и разблокировки
+        на других воркерах попадают в индекс этого процесса (0 - выключено)"""
+        if interval > 0:
+            self.blocked_ips.start_refresh(self.blocked_ips_version, self.fetch_blocked_ips, interval)
     
     def log_threat(self, ip: str, threat_type: str, details: str, request_data: dict, severity: str = 'HIGH', blocked: bool = True):
         """Логирование обнаруженных угроз"""
         try:
-            threat_db_path = 'instance/threats.db'
-            conn = sqlite3.connect(threat_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO security_logs 
-                (ip_address, user_agent, threat_type, threat_details, request_path, request_method, severity, blocked)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            # Запись уходит в очередь фонового писателя, поток запроса не ждет диск
+            self.store.enqueue_log(
                 ip,
                 request_data.get('user_agent', ''),
                 threat_type,
@@ -189,96 +188,72 @@ class SecurityThreatDetector:
                 request_data.get('method', ''),
                 severity,
                 blocked
-            ))
-            
-            conn.commit()
-            conn.close()
+            )
             
             # Обновляем статистику активности IP
             self.ip_activity[ip]['threats'] += 1
             self.ip_activity[ip]['last_activity'] = time.time()
             
-            print(f"🚨 УГРОЗА ОБНАРУЖЕНА: {threat_type} от IP {ip}")
+            # Повторы того же IP и типа угрозы в пределах секунды только считаются
+            security_events.emit(
+                'threat_detected', f"🚨 УГРОЗА ОБНАРУЖЕНА: {threat_type} от IP {ip}", level='warning',
+                sample_key=(ip, threat_type), ip=ip, threat_type=threat_type, details=details,
+                path=request_data.get('path', ''), method=request_data.get('method', ''), severity=severity
+            )
             
         except Exception as e:
-            print(f"❌ Ошибка логирования угрозы: {e}")
+            security_events.emit('threat_log_error', f"❌ Ошибка логирования угрозы: {e}", level='error',
+                                 sample_key=(type(e).__name__,), error=str(e))
     
     def block_ip(self, ip: str, reason: str, duration_hours: int = 24, permanent: bool = False):
         """Блокировка IP адреса"""
         try:
-            # Добавляем в память
-            self.blocked_ips.add(ip)
-            
-            # Сохраняем в базу данных
-            threat_db_path = 'instance/threats.db'
-            conn = sqlite3.connect(threat_db_path)
-            cursor = conn.cursor()
-            
             expires_at = None if permanent else datetime.now() + timedelta(hours=duration_hours)
             
-            cursor.execute('''
+            # Добавляем в память (до записи в БД индекс хранит блокировку поверх перечитанных данных)
+            written = threading.Event()
+            self.blocked_ips.add(ip, None if expires_at is None else expires_at.timestamp(), written)
+            
+            # Сохраняем в базу данных фоновым писателем: ответ 403 зависит только от индекса в памяти
+            self.store.enqueue_execute('''
                 INSERT OR REPLACE INTO blocked_ips 
                 (ip_address, reason, expires_at, is_permanent)
                 VALUES (?, ?, ?, ?)
-            ''', (ip, reason, expires_at, permanent))
+            ''', (ip, reason, expires_at, permanent), done=written)
             
-            conn.commit()
-            conn.close()
-            
-            print(f"🚫 IP {ip} заблокирован на {duration_hours} часов. Причина: {reason}")
+            security_events.emit(
+                'ip_blocked', f"🚫 IP {ip} заблокирован на {duration_hours:g} часов. Причина: {reason}", level='warning',
+                ip=ip, reason=reason, duration_hours=duration_hours, permanent=permanent
+            )
             
         except Exception as e:
-            print(f"❌ Ошибка блокировки IP: {e}")
+            security_events.emit('ip_block_error', f"❌ Ошибка блокировки IP: {e}", level='error', ip=ip, error=str(e))
+    
+    def escalate_block(self, ip: str, reason: str, kind: str):
+        """Автоматическая блокировка со сроком по числу прошлых нарушений IP"""
+        # Нарушения и tarpit - по адресу, которому можно доверять, а не по заголовку клиента
+        client_ip = self.escalation.client_ip(request.environ) if has_request_context() else ip
+        strikes, hours, tarpitted = self.escalation.strike(client_ip, kind)
+        if strikes > 1:
+            reason = f"{reason} (нарушение №{strikes})"
+        self.block_ip(ip, reason, duration_hours=hours)
+        if tarpitted:
+            security_events.emit(
+                'ip_tarpitted', f"🕳️ IP {client_ip} переведен в tarpit на {hours:g} часов (нарушение №{strikes})",
+                level='warning', ip=client_ip, strikes=strikes, duration_hours=hours
+            )
     
     def is_ip_blocked(self, ip: str) -> bool:
-        """Проверка, заблокирован ли IP"""
-        # Проверяем в памяти
-        if ip in self.blocked_ips:
-            return True
-        
-        # Проверяем в базе данных
-        try:
-            threat_db_path = 'instance/threats.db'
-            conn = sqlite3.connect(threat_db_path)
-            cursor = conn.cursor()
-            
-            # Проверяем активные блокировки
-            cursor.execute('''
-                SELECT is_permanent, expires_at FROM blocked_ips 
-                WHERE ip_address = ? AND (is_permanent = 1 OR expires_at > datetime('now'))
-            ''', (ip,))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                if result[0]:  # permanent
-                    self.blocked_ips.add(ip)
-                    return True
-                else:
-                    self.blocked_ips.add(ip)
-                    return True
-            
-            return False
-            
-        except Exception as e:
-            print(f"❌ Ошибка проверки блокировки IP: {e}")
-            return False
+        """Проверка, заблокирован ли IP (только индекс в памяти, без запроса к БД)"""
+        return ip in self.blocked_ips
     
     def check_rate_limit(self, ip: str, limit: int = 100, window_seconds: int = 3600) -> bool:
         """Проверка лимита запросов"""
-        current_time = time.time()
-        rate_data = self.rate_limits[ip]
+        # Запрос сверх лимита не учитывается, счетчик не растет бесконечно
+        allowed, count = self.rate_limit_backend.hit(f"ips:{ip}", window_seconds, limit)
         
-        # Сброс счетчика если окно прошло
-        if current_time - rate_data['reset_time'] > window_seconds:
-            rate_data['count'] = 0
-            rate_data['reset_time'] = current_time
-        
-        rate_data['count'] += 1
-        
-        if rate_data['count'] > limit:
-            self.block_ip(ip, f"Превышен лимит запросов: {rate_data['count']}/{limit}", duration_hours=1)
+        if not allowed:
+            self.escalate_block(ip, f"Превышен лимит запросов: {count + 1}/{limit}", 'rate_limit')
             return False
         
         return True
@@ -289,126 +264,235 @@ class SecurityThreatDetector:
         ip = request_data.get('ip', '')
         
         # Проверяем блокировку IP
-        if self.is_ip_blocked(ip):
+        with stage_metrics.time('ip_block_check'):
+            blocked = self.is_ip_blocked(ip)
+        if blocked:
             return True, ['IP заблокирован']
         
         # Проверяем rate limiting
-        if not self.check_rate_limit(ip):
+        with stage_metrics.time('rate_limit'):
+            allowed = self.check_rate_limit(ip)
+        if not allowed:
             return True, ['Превышен лимит запросов']
         
-        # Проверяем паттерны угроз
-        for threat_type, patterns in self.threat_patterns.items():
-            for pattern in patterns:
-                try:
-                    if re.search(pattern, str(request_data.get('data', '')), re.IGNORECASE | re.MULTILINE):
-                        threats.append(threat_type)
-                        
-                        # Логируем угрозу
-                        self.log_threat(ip, threat_type, f"Обнаружен паттерн: {pattern}", request_data)
-                        
-                        # Блокируем при критических угрозах
-                        if threat_type in ['sql_injection', 'command_injection', 'path_traversal']:
-                            self.block_ip(ip, f"Критическая угроза: {threat_type}", duration_hours=24)
-                            return True, threats
-                        
-                except Exception as e:
-                    print(f"❌ Ошибка проверки паттерна {pattern}: {e}")
+        # Проверяем паттерны угроз: окна потоковой проверки тела или строка данных целиком
+        windows = request_data.get('data_windows')
+        if windows is None:
+            windows = [str(request_data.get('data', ''))]
+        try:
+            # Повторные одинаковые запросы берут совпадения из кэша, угрозы все равно логируются
+            with stage_metrics.time('pattern_scan'):
+                matches = self.scan_payload(request_data, windows)
+            for threat_type, pattern in matches:
+                threats.append(threat_type)
+                
+                # Логируем угрозу
+                self.log_threat(ip, threat_type, f"Обнаружен паттерн: {pattern}", request_data)
+                
+                # Блокируем при критических угрозах
+                if threat_type in CRITICAL_THREAT_TYPES:
+                    self.escalate_block(ip, f"Критическая угроза: {threat_type}", 'critical')
+                    return True, threats
+                
+        except Exception as e:
+            security_events.emit('pattern_scan_error', f"❌ Ошибка проверки паттернов: {e}", level='error',
+                                 sample_key=(type(e).__name__,), error=str(e))
         
         # Дополнительные проверки
-        if self.is_suspicious_request(request_data):
+        with stage_metrics.time('suspicious_heuristics'):
+            suspicious = self.is_suspicious_request(request_data)
+        if suspicious:
             threats.append('suspicious_activity')
             self.log_threat(ip, 'suspicious_activity', 'Подозрительная активность', request_data)
         
         return len(threats) > 0, threats
     
+    def scan_payload(self, request_data: dict, windows: List[str]) -> Tuple[Tuple[str, str], ...]:
+        """Совпадения сигнатур (без повторов) с кэшем по дайджесту пути, метода и тела"""
+        request_class = request_data.get('request_class')
+        exclude = SCAN_EXCLUDED_CATEGORIES.get(request_class, ())
+        
+        cache = self.verdict_cache
+        key = None
+        if cache.max_keys > 0:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(f"{request_data.get('method', '')}\0{request_data.get('path', '')}\0{request_class}".encode())
+            for window in windows:
+                digest.update(b'\0')
+                digest.update(window.encode('utf-8', 'surrogatepass'))
+            key = digest.digest()
+            try:
+                matches = cache[key]
+            except KeyError:
+                self.verdict_cache_stats['misses'] += 1
+            else:
+                self.verdict_cache_stats['hits'] += 1
+                if matches:
+                    self.verdict_cache_stats['threat_hits'] += 1
+                return matches
+        
+        # Совпадение в перекрытии соседних окон учитываем один раз
+        matches = tuple(dict.fromkeys(self.iter_window_matches(windows, exclude)))
+        if key is not None:
+            cache[key] = matches
+        return matches
+    
+    def get_verdict_cache_stats(self) -> dict:
+        """Размер кэша результатов и доля попаданий"""
+        stats = self.verdict_cache_stats
+        lookups = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            'entries': len(self.verdict_cache),
+            'max_entries': self.verdict_cache.max_keys,
+            'evicted_lru': self.verdict_cache.stats['evicted_lru']
+        }
+    
+    def iter_window_matches(self, windows: List[str], exclude=()):
+        """Совпадения сигнатур по всем окнам текста запроса"""
+        for window in windows:
+            yield from self.pattern_engine.iter_matches(window, exclude=exclude)
+    
     def is_suspicious_request(self, request_data: dict) -> bool:
         """Дополнительные проверки подозрительной активности"""
         suspicious_indicators = 0
         
-        # Проверяем User-Agent
-        user_agent = request_data.get('user_agent', '').lower()
-        for pattern in self.threat_patterns['suspicious_user_agents']:
-            if re.search(pattern, user_agent, re.IGNORECASE):
-                suspicious_indicators += 1
+        # Проверяем User-Agent (каждая сработавшая сигнатура - отдельный признак)
+        suspicious_indicators += self.classify_user_agent(request_data.get('user_agent', ''))
         
-        # Проверяем частоту запросов
+        # Проверяем частоту запросов: учитываем текущий запрос в счетчике минуты за O(1)
         ip = request_data.get('ip', '')
-        if ip in self.ip_activity:
-            recent_requests = [t for t in self.ip_activity[ip]['requests'] 
-                             if time.time() - t < 60]  # последние 60 секунд
-            if len(recent_requests) > 50:  # более 50 запросов в минуту
-                suspicious_indicators += 1
+        current_time = time.time()
+        activity = self.ip_activity[ip]
+        counter = activity['requests']
+        counter.advance(current_time)
+        counter.add()
+        activity['last_activity'] = current_time
+        if counter.total > 50:  # более 50 запросов в минуту
+            suspicious_indicators += 1
         
         # Проверяем размер запроса
-        data_size = len(str(request_data.get('data', '')))
+        data_size = request_data.get('data_size')
+        if data_size is None:
+            data_size = len(str(request_data.get('data', '')))
         if data_size > 100000:  # более 100KB
             suspicious_indicators += 1
         
         return suspicious_indicators >= 2
     
+    def classify_user_agent(self, user_agent: str) -> int:
+        """Число сигнатур suspicious_user_agents в User-Agent (с кэшем по строке UA)"""
+        cacheable = len(user_agent) <= 1024
+        if cacheable:
+            try:
+                # Обращение по ключу продлевает запись в LRU
+                return self.user_agent_cache[user_agent]
+            except KeyError:
+                pass
+        
+        folded = fold_case(user_agent)
+        count = sum(1 for regex in self.user_agent_regexes if regex.search(folded))
+        if cacheable:
+            self.user_agent_cache[user_agent] = count
+        return count
+    
     def get_threat_statistics(self) -> dict:
         """Получение статистики угроз"""
         try:
-            threat_db_path = 'instance/threats.db'
-            conn = sqlite3.connect(threat_db_path)
-            cursor = conn.cursor()
+            store = self.store
             
-            # Общая статистика
-            cursor.execute('SELECT COUNT(*) FROM security_logs WHERE timestamp > datetime("now", "-24 hours")')
-            threats_last_24h = cursor.fetchone()[0]
+            # Статистика читается из поминутных агрегатов, а не из security_logs
+            since = "strftime('%Y-%m-%d %H:%M', 'now', '-24 hours')"
             
             # Статистика по типам угроз
-            cursor.execute('''
-                SELECT threat_type, COUNT(*) 
-                FROM security_logs 
-                WHERE timestamp > datetime("now", "-24 hours")
+            threat_types = dict(store.fetchall(f'''
+                SELECT threat_type, SUM(count) 
+                FROM security_rollup_threat_minute 
+                WHERE minute >= {since}
                 GROUP BY threat_type
-            ''')
-            threat_types = dict(cursor.fetchall())
+            '''))
+            
+            # Общая статистика
+            threats_last_24h = sum(threat_types.values())
             
             # Топ атакующих IP
-            cursor.execute('''
-                SELECT ip_address, COUNT(*) 
-                FROM security_logs 
-                WHERE timestamp > datetime("now", "-24 hours")
+            top_attackers = dict(store.fetchall(f'''
+                SELECT ip_address, SUM(count) 
+                FROM security_rollup_ip_minute 
+                WHERE minute >= {since}
                 GROUP BY ip_address 
-                ORDER BY COUNT(*) DESC 
+                ORDER BY SUM(count) DESC 
                 LIMIT 10
-            ''')
-            top_attackers = dict(cursor.fetchall())
+            '''))
             
             # Заблокированные IP
-            cursor.execute('SELECT COUNT(*) FROM blocked_ips WHERE is_permanent = 0 AND expires_at > datetime("now")')
-            active_blocks = cursor.fetchone()[0]
-            
-            conn.close()
+            active_blocks = store.fetchone('SELECT COUNT(*) FROM blocked_ips WHERE is_permanent = 0 AND expires_at > datetime("now")')[0]
             
             return {
                 'threats_last_24h': threats_last_24h,
                 'threat_types': threat_types,
                 'top_attackers': top_attackers,
                 'active_blocks': active_blocks,
-                'total_blocked_ips': len(self.blocked_ips)
+                'total_blocked_ips': len(self.blocked_ips),
+                'log_writer': store.get_metrics(),
+                'ip_tracking': self.ip_activity.get_stats(),
+                'user_agent_cache': self.user_agent_cache.get_stats(),
+                'request_classes': dict(self.request_class_counts),
+                'rate_limit_state': self.rate_limit_backend.get_stats(),
+                'log_retention': self.retention.get_stats(),
+                'verdict_cache': self.get_verdict_cache_stats(),
+                'event_log': security_events.get_stats(),
+                'escalation': self.escalation.get_stats(),
+                'blocklist_refresh': dict(self.blocked_ips.refresh_stats)
             }
             
         except Exception as e:
-            print(f"❌ Ошибка получения статистики: {e}")
+            security_events.emit('stats_error', f"❌ Ошибка получения статистики: {e}", level='error', error=str(e))
             return {}
 
 # Глобальный экземпляр детектора угроз
 threat_detector = SecurityThreatDetector()
 
+# Потоковая проверка тела запроса (не более SECURITY_MAX_INSPECT_BYTES байт)
+body_inspector = StreamingBodyInspector()
+
+def get_url_payload() -> str:
+    """Путь и строка запроса текущего запроса для проверки"""
+    return url_payload(request.path, request.query_string.decode('latin-1'))
+
 def security_middleware():
     """Middleware для проверки безопасности запросов"""
     try:
+        # Нормализованный адрес: им же блокирует escalate_block и ищет BlocklistIndex
+        ip = BlocklistIndex.client_address(request.headers.get('X-Forwarded-For', request.remote_addr) or '')
+        request_class = classify_request(request.path, request.method, request.content_length)
+        threat_detector.request_class_counts[request_class] += 1
+        
+        # Статика и мониторинг: только проверка блокировки, без разбора запроса
+        if request_class in ('static', 'monitoring'):
+            with stage_metrics.time('ip_block_check'):
+                blocked = threat_detector.is_ip_blocked(ip)
+            if blocked:
+                abort(403, description='Доступ заблокирован из-за подозрительной активности')
+            g.security_checked = True
+            g.request_ip = ip
+            return
+        
         # Собираем данные запроса
         request_data = {
-            'ip': request.headers.get('X-Forwarded-For', request.remote_addr),
+            'ip': ip,
             'user_agent': request.headers.get('User-Agent', ''),
             'path': request.path,
             'method': request.method,
-            'data': str(request.get_data())
+            'request_class': request_class
         }
+        if request_class == 'url_only':
+            request_data['data'] = get_url_payload()
+        else:
+            # Тело читается частями без копии целиком, поток остается для обработчиков
+            request_data['data_windows'] = body_inspector.inspect_request(request)
+            request_data['data_size'] = request.content_length or 0
         
         # Обнаруживаем угрозы
         is_threat, threats = threat_detector.detect_threats(request_data)
@@ -431,31 +515,40 @@ def security_middleware():
         g.request_ip = request_data['ip']
         
     except Exception as e:
-        print(f"❌ Ошибка в security middleware: {e}")
+        security_events.emit('middleware_error', f"❌ Ошибка в security middleware: {e}", level='error',
+                             sample_key=(type(e).__name__,), path=request.path, error=str(e))
 
 def get_security_stats():
     """Получение статистики безопасности"""
     return threat_detector.get_threat_statistics()
 
 def force_block_ip(ip: str, reason: str = "Ручная блокировка", hours: int = 24):
-    """Принудительная блокировка IP"""
+    """Принудительная блокировка IP или подсети (CIDR, например 203.0.113.0/24)"""
+    try:
+        ip = BlocklistIndex.normalize(ip)
+    except ValueError:
+        return {"status": "error", "message": f"Некорректный IP адрес или подсеть: {ip}"}
+    
     threat_detector.block_ip(ip, reason, duration_hours=hours)
     return {"status": "blocked", "ip": ip, "reason": reason}
 
 def unblock_ip(ip: str):
     """Разблокировка IP"""
     try:
-        threat_db_path = 'instance/threats.db'
-        conn = sqlite3.connect(threat_db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM blocked_ips WHERE ip_address = ?', (ip,))
+        try:
+            ip = BlocklistIndex.normalize(ip)
+        except ValueError:
+            pass
         
-        conn.commit()
-        conn.close()
+        # Через ту же очередь, что и block_ip: удаление не обгонит еще не записанную блокировку
+        written = threading.Event()
+        threat_detector.store.enqueue_execute('DELETE FROM blocked_ips WHERE ip_address = ?', (ip,), done=written)
         
         # Удаляем из памяти
-        threat_detector.blocked_ips.discard(ip)
+        threat_detector.blocked_ips.discard(ip, written)
+        
+        # Ручная разблокировка прощает прошлые нарушения
+        threat_detector.escalation.forgive(ip)
         
         return {"status": "unblocked", "ip": ip}
         
@@ -0,0 +1,105 @@
+"""
+🔎 ПРЕДФИЛЬТР ПО ЛИТЕРАЛАМ
+CyberGuardian - Регулярка проверяется, только если в тексте есть ее обязательный литерал
+"""
+
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+try:
+    # Парсер регулярных выражений стандартной библиотеки (Python 3.11+)
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+# Символы вне ASCII, которые re.IGNORECASE считает равными латинским буквам:
+# İ/ı ~ i, ſ ~ s, K (знак Кельвина) ~ k. str.lower() их так не сворачивает.
+ASCII_CASE_FOLD = {0x130: 'i', 0x131: 'i', 0x17f: 's', 0x212a: 'k'}
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def fold_case(text: str) -> str:
+    """Нижний регистр с теми же совпадениями латиницы, что и у re.IGNORECASE"""
+    if text.isascii():
+        return text.lower()
+    return text.translate(ASCII_CASE_FOLD).lower()
+
+
+def _sequence_literals(items) -> Optional[Set[str]]:
+    """Лучший набор литералов последовательности: каждое совпадение содержит один из них"""
+    candidates = []
+    run = []
+
+    def flush():
+        if run:
+            candidates.append({''.join(run)})
+            run.clear()
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av).lower())
+            continue
+        flush()
+
+        if op is sre_constants.SUBPATTERN:
+            literals = _sequence_literals(av[-1])
+        elif op is sre_constants.BRANCH:
+            # Ветвление: литерал нужен в каждой ветке
+            branches = [_sequence_literals(branch) for branch in av[1]]
+            literals = None if any(b is None for b in branches) else set().union(*branches)
+        elif op in _REPEATS and av[0] >= 1:
+            literals = _sequence_literals(av[2])
+        else:
+            literals = None
+
+        if literals:
+            candidates.append(literals)
+    flush()
+
+    if not candidates:
+        return None
+    # Предпочитаем самые длинные литералы: короткие чаще встречаются в чистом тексте
+    return max(candidates, key=lambda literals: (min(map(len, literals)), -len(literals)))
+
+
+def required_literals(pattern: str, flags: int = 0) -> Optional[Set[str]]:
+    """Литералы (в нижнем регистре), один из которых есть в любом совпадении паттерна"""
+    try:
+        return _sequence_literals(sre_parse.parse(pattern, flags))
+    except Exception:
+        return None
+
+
+class LiteralPrefilter:
+    """🔎 Поиск обязательных литералов всех паттернов за один проход по тексту"""
+
+    def __init__(self, patterns: Iterable[Tuple[Hashable, str, int]]):
+        # {литерал: [ключи паттернов]} и паттерны без литерала (проверяются всегда)
+        self.literals: Dict[str, List[Hashable]] = {}
+        self.always: List[Hashable] = []
+        for key, pattern, flags in patterns:
+            literals = required_literals(pattern, flags)
+            if not literals:
+                self.always.append(key)
+                continue
+            for literal in literals:
+                self.literals.setdefault(literal, []).append(key)
+
+    def candidates(self, folded_text: str) -> Set[Hashable]:
+        """Ключи паттернов, которые стоит проверить (текст - после fold_case)"""
+        found = set(self.always)
+        # Поиск подстроки в C для каждого литерала: автомат Ахо-Корасик на чистом Python
+        # в несколько раз медленнее, а C-реализация потребовала бы новой зависимости
+        for literal, keys in self.literals.items():
+            if literal in folded_text:
+                found.update(keys)
+        return found
+
+    def get_stats(self) -> Dict:
+        return {
+            'literals': len(self.literals),
+            'unfiltered_patterns': len(self.always)
+        }
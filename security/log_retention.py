@@ -0,0 +1,350 @@
+"""
+🗃️ ХРАНЕНИЕ И АРХИВАЦИЯ ЖУРНАЛА УГРОЗ
+CyberGuardian - Ротация security_logs по дням в сжатый архив и удаление старых данных
+
+Архив: instance/security_archive/security_logs-ГГГГ-ММ-ДД.jsonl.gz (одна строка JSON на запись)
+
+Запуск вручную:
+    python -m security.log_retention run
+    python -m security.log_retention query --since 2024-01-01 --ip 203.0.113.7
+"""
+
+import argparse
+import gzip
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from security.event_log import security_events
+
+ARCHIVE_PREFIX = 'security_logs-'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+LOG_COLUMNS = (
+    'id', 'timestamp', 'ip_address', 'user_agent', 'threat_type', 'threat_details',
+    'request_path', 'request_method', 'severity', 'blocked'
+)
+
+ROLLUP_TABLES = ('security_rollup_threat_minute', 'security_rollup_ip_minute')
+
+
+def archive_path(archive_dir: str, day: str) -> str:
+    """Файл архива за день (day - ГГГГ-ММ-ДД)"""
+    return os.path.join(archive_dir, f'{ARCHIVE_PREFIX}{day}{ARCHIVE_SUFFIX}')
+
+
+def list_archive_days(archive_dir: str) -> List[str]:
+    """Дни, для которых есть архив, по возрастанию"""
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(
+        name[len(ARCHIVE_PREFIX):-len(ARCHIVE_SUFFIX)]
+        for name in os.listdir(archive_dir)
+        if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)
+    )
+
+
+def iter_archive(archive_dir: str, since: Optional[str] = None, until: Optional[str] = None,
+                 ip: Optional[str] = None, threat_type: Optional[str] = None) -> Iterator[Dict]:
+    """Записи архива за дни [since, until] с фильтрами (без обращения к threats.db)"""
+    for day in list_archive_days(archive_dir):
+        if (since and day < since[:10]) or (until and day > until[:10]):
+            continue
+        with gzip.open(archive_path(archive_dir, day), 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if ip and record['ip_address'] != ip:
+                    continue
+                if threat_type and record['threat_type'] != threat_type:
+                    continue
+                yield record
+
+
+class LogRetention:
+    """🗃️ Фоновая ротация security_logs: архив по дням, горизонт хранения, очистка агрегатов"""
+
+    def __init__(self, db_path: str = 'instance/threats.db', archive_dir: str = None,
+                 hot_days: int = None, retention_days: int = None, batch_rows: int = 2000,
+                 interval_seconds: int = None, rollup_hours: int = 48):
+        self.db_path = db_path
+        self.archive_dir = archive_dir or os.getenv('SECURITY_LOG_ARCHIVE_DIR', 'instance/security_archive')
+        # Дни, которые остаются в security_logs (быстрый поиск по свежим записям)
+        self.hot_days = hot_days if hot_days is not None else int(os.getenv('SECURITY_LOG_HOT_DAYS', 7))
+        # Горизонт хранения: старше него удаляются и строки, и архивы (0 - архив хранится бессрочно)
+        self.retention_days = (retention_days if retention_days is not None
+                               else int(os.getenv('SECURITY_LOG_RETENTION_DAYS', 90)))
+        self.archive_enabled = os.getenv('SECURITY_LOG_ARCHIVE', '1') == '1'
+        self.batch_rows = batch_rows
+        self.interval = interval_seconds or int(os.getenv('SECURITY_LOG_RETENTION_INTERVAL', 3600))
+        # Поминутные агрегаты нужны только статистике за сутки
+        self.rollup_hours = rollup_hours
+        # Пауза между пакетами удаления, чтобы писатель журнала не ждал блокировку
+        self.pause_seconds = 0.05
+        self.lease_seconds = 600
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        self.metrics = {
+            'runs': 0,
+            'archived_days': 0,
+            'archived_rows': 0,
+            'deleted_rows': 0,
+            'pruned_rollup_rows': 0,
+            'removed_archives': 0,
+            'last_run': None,
+            'last_error': None
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: короткие транзакции BEGIN IMMEDIATE на каждый пакет
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS security_maintenance (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                lease_until REAL
+            )
+        ''')
+        return conn
+
+    # ------------------------------------------------------------------
+    # Фоновый поток (по одному на воркер, работу выполняет владелец аренды)
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Запуск фонового потока в текущем процессе (повторный вызов безопасен)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread and self._thread.is_alive():
+            return
+        self._pid = pid
+        self.owner = f'{socket.gethostname()}:{pid}'
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='security-log-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # Первый проход - вскоре после старта, затем раз в interval секунд
+        delay = min(60, self.interval)
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                self.run_once()
+            except Exception as e:
+                self.metrics['last_error'] = str(e)
+                security_events.emit('log_retention_error', f"❌ Ошибка обслуживания журнала угроз: {e}",
+                                     level='error', error=str(e))
+
+    def _acquire_lease(self, conn: sqlite3.Connection) -> bool:
+        """Аренда задачи: ротацию одновременно выполняет только один воркер"""
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT owner, lease_until FROM security_maintenance WHERE name = 'log_retention'"
+            ).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                conn.execute('COMMIT')
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO security_maintenance (name, owner, lease_until) VALUES ('log_retention', ?, ?)",
+                (self.owner, now + self.lease_seconds)
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _release_lease(self, conn: sqlite3.Connection):
+        conn.execute(
+            "UPDATE security_maintenance SET lease_until = 0 WHERE name = 'log_retention' AND owner = ?",
+            (self.owner,)
+        )
+
+    # ------------------------------------------------------------------
+    # Один проход обслуживания
+    # ------------------------------------------------------------------
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict:
+        """Ротация дней старше hot_days, удаление данных за горизонтом, очистка агрегатов"""
+        now = now or datetime.utcnow()
+        conn = self._connect()
+        try:
+            if not self._acquire_lease(conn):
+                return {'skipped': True}
+
+            try:
+                result = {'archived_days': [], 'deleted_rows': 0, 'pruned_rollup_rows': 0, 'removed_archives': 0}
+                today = now.strftime('%Y-%m-%d')
+                hot_cutoff = (now - timedelta(days=self.hot_days)).strftime('%Y-%m-%d')
+                horizon = ((now - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+                           if self.retention_days else None)
+
+                # Без архива дни между hot_days и горизонтом остаются в БД: иначе они удалялись бы
+                # раньше срока хранения, без копии
+                cutoff = min(hot_cutoff, today) if self.archive_enabled else horizon
+                days = self._days_before(conn, cutoff) if cutoff is not None else []
+                for day in days:
+                    expired = horizon is not None and day < horizon
+                    if self.archive_enabled and not expired:
+                        rows = self._archive_day(conn, day)
+                        result['archived_days'].append(day)
+                        self.metrics['archived_days'] += 1
+                        self.metrics['archived_rows'] += rows
+                    result['deleted_rows'] += self._delete_day(conn, day)
+
+                minute_cutoff = (now - timedelta(hours=self.rollup_hours)).strftime('%Y-%m-%d %H:%M')
+                for table in ROLLUP_TABLES:
+                    result['pruned_rollup_rows'] += self._delete_batches(
+                        conn, f'SELECT rowid FROM {table} WHERE minute < ?', (minute_cutoff,), table, 'rowid'
+                    )
+
+                if horizon is not None:
+                    result['removed_archives'] = self._remove_archives(horizon)
+
+                self.metrics['runs'] += 1
+                self.metrics['deleted_rows'] += result['deleted_rows']
+                self.metrics['pruned_rollup_rows'] += result['pruned_rollup_rows']
+                self.metrics['removed_archives'] += result['removed_archives']
+                self.metrics['last_run'] = now.strftime('%Y-%m-%d %H:%M:%S')
+                self.metrics['last_error'] = None
+                return result
+            finally:
+                self._release_lease(conn)
+        finally:
+            conn.close()
+
+    def _days_before(self, conn: sqlite3.Connection, cutoff: str) -> List[str]:
+        """Дни с записями раньше cutoff (по индексу idx_security_logs_timestamp)"""
+        days = []
+        day = ''
+        while True:
+            # Переход к следующему дню через индекс, без сканирования всех строк дня
+            row = conn.execute(
+                'SELECT substr(MIN(timestamp), 1, 10) FROM security_logs WHERE timestamp >= ? AND timestamp < ?',
+                (self._next_day(day) if day else '', cutoff)
+            ).fetchone()
+            if row is None or row[0] is None:
+                return days
+            day = row[0]
+            days.append(day)
+
+    @staticmethod
+    def _next_day(day: str) -> str:
+        return (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def _archive_day(self, conn: sqlite3.Connection, day: str) -> int:
+        """Выгрузка дня в сжатый файл; файл появляется атомарно после полной записи"""
+        path = archive_path(self.archive_dir, day)
+        if os.path.exists(path):
+            # Предыдущий проход успел выгрузить день, но не удалить строки
+            return 0
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_path = f'{path}.tmp'
+        rows = 0
+        # Чтение в WAL не блокирует писателя журнала
+        cursor = conn.execute(
+            f"SELECT {', '.join(LOG_COLUMNS)} FROM security_logs "
+            'WHERE timestamp >= ? AND timestamp < ? ORDER BY id',
+            (day, self._next_day(day))
+        )
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            while True:
+                batch = cursor.fetchmany(self.batch_rows)
+                if not batch:
+                    break
+                for row in batch:
+                    f.write(json.dumps(dict(zip(LOG_COLUMNS, row)), ensure_ascii=False))
+                    f.write('\n')
+                rows += len(batch)
+        os.replace(temp_path, path)
+        return rows
+
+    def _delete_day(self, conn: sqlite3.Connection, day: str) -> int:
+        return self._delete_batches(
+            conn, 'SELECT id FROM security_logs WHERE timestamp >= ? AND timestamp < ?',
+            (day, self._next_day(day)), 'security_logs', 'id'
+        )
+
+    def _delete_batches(self, conn: sqlite3.Connection, select_sql: str, params: tuple,
+                        table: str, key: str) -> int:
+        """Удаление небольшими пакетами: каждая транзакция держит блокировку записи миллисекунды"""
+        deleted = 0
+        while not self._stop.is_set():
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute(
+                    f'DELETE FROM {table} WHERE {key} IN ({select_sql} LIMIT ?)',
+                    (*params, self.batch_rows)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            deleted += cursor.rowcount
+            if cursor.rowcount < self.batch_rows:
+                break
+            time.sleep(self.pause_seconds)
+        return deleted
+
+    def _remove_archives(self, horizon: str) -> int:
+        removed = 0
+        for day in list_archive_days(self.archive_dir):
+            if day >= horizon:
+                break
+            os.remove(archive_path(self.archive_dir, day))
+            removed += 1
+        return removed
+
+    def get_stats(self) -> Dict:
+        """Настройки и счетчики обслуживания"""
+        return {
+            **self.metrics,
+            'hot_days': self.hot_days,
+            'retention_days': self.retention_days,
+            'archive_enabled': self.archive_enabled,
+            'archive_dir': self.archive_dir,
+            'archive_days': len(list_archive_days(self.archive_dir))
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Обслуживание журнала угроз CyberGuardian')
+    parser.add_argument('--db', default='instance/threats.db')
+    parser.add_argument('--archive-dir', default=None)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('run', help='Один проход ротации и очистки')
+
+    query = commands.add_parser('query', help='Поиск по архиву (JSON lines в stdout)')
+    query.add_argument('--since')
+    query.add_argument('--until')
+    query.add_argument('--ip')
+    query.add_argument('--threat-type')
+
+    args = parser.parse_args(argv)
+    retention = LogRetention(args.db, archive_dir=args.archive_dir)
+
+    if args.command == 'run':
+        print(json.dumps(retention.run_once(), ensure_ascii=False))
+    else:
+        for record in iter_archive(retention.archive_dir, args.since, args.until, args.ip, args.threat_type):
+            print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
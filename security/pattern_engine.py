@@ -0,0 +1,108 @@
+"""
+⚡ СКОМПИЛИРОВАННЫЙ ДВИЖОК ПАТТЕРНОВ УГРОЗ
+CyberGuardian - Однопроходная проверка запросов по сигнатурам атак
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from security.literal_prefilter import LiteralPrefilter, fold_case
+from security.event_log import security_events
+
+
+class ThreatPatternEngine:
+    """⚡ Движок сигнатур: одна объединённая регулярка на категорию угроз"""
+
+    def __init__(self, threat_patterns: Dict[str, List[str]], prefilter: bool = True):
+        # {категория: [(исходный паттерн, скомпилированный паттерн)]}
+        self.patterns = {}
+        # {категория: объединённая регулярка всех паттернов категории}
+        self.combined = {}
+        # Предфильтр по обязательным литералам паттернов (None - проверка без него)
+        self.use_prefilter = prefilter
+        self.prefilter = None
+        self.compile(threat_patterns)
+
+    @staticmethod
+    def _flags(patterns: List[str]) -> int:
+        """Флаги компиляции для паттернов, проверяемых по тексту в нижнем регистре"""
+        # Текст приводится к нижнему регистру один раз, поэтому IGNORECASE нужен
+        # только паттернам с заглавными литералами. Без него re может искать
+        # литеральный префикс паттерна быстрым поиском подстроки.
+        flags = re.MULTILINE
+        if any(pattern != pattern.lower() for pattern in patterns):
+            flags |= re.IGNORECASE
+        return flags
+
+    def compile(self, threat_patterns: Dict[str, List[str]]):
+        """Компиляция всех паттернов (выполняется один раз при старте)"""
+        self.patterns = {}
+        self.combined = {}
+
+        for threat_type, patterns in threat_patterns.items():
+            compiled = []
+            for pattern in patterns:
+                try:
+                    compiled.append((pattern, re.compile(pattern, self._flags([pattern]))))
+                except re.error as e:
+                    security_events.emit('pattern_compile_error', f"❌ Ошибка компиляции паттерна {pattern}: {e}",
+                                         level='error', pattern=pattern, error=str(e))
+
+            self.patterns[threat_type] = compiled
+            if compiled:
+                # Незахватывающие группы: sre разворачивает их и может пропускать
+                # позиции по первому символу ветки, именованные группы этому мешают
+                sources = [pattern for pattern, _ in compiled]
+                alternation = '|'.join(f"(?:{pattern})" for pattern in sources)
+                self.combined[threat_type] = re.compile(alternation, self._flags(sources))
+
+        if self.use_prefilter:
+            # Ключ паттерна - (категория, номер в списке категории)
+            self.prefilter = LiteralPrefilter(
+                ((threat_type, index), pattern, regex.flags)
+                for threat_type, compiled in self.patterns.items()
+                for index, (pattern, regex) in enumerate(compiled)
+            )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Подготовка текста к проверке (один раз на запрос)"""
+        # Как str.lower(), но İ, ı, ſ и K сворачиваются в латиницу, как при re.IGNORECASE
+        return fold_case(text)
+
+    def iter_matches(self, text: str, normalized: bool = False,
+                     exclude: Iterable[str] = ()) -> Iterator[Tuple[str, str]]:
+        """Все совпадения (категория, паттерн) в порядке объявления паттернов"""
+        if not normalized:
+            text = self.normalize(text)
+
+        if self.prefilter is not None:
+            # Один проход поиска литералов вместо регулярок всех категорий
+            candidates = self.prefilter.candidates(text)
+            for threat_type, compiled in self.patterns.items():
+                if threat_type in exclude:
+                    continue
+                for index, (pattern, regex) in enumerate(compiled):
+                    if (threat_type, index) in candidates and regex.search(text):
+                        yield threat_type, pattern
+            return
+
+        for threat_type, combined in self.combined.items():
+            if threat_type in exclude:
+                continue
+
+            # Быстрый отказ: один проход по тексту на всю категорию
+            if not combined.search(text):
+                continue
+
+            # Категория сработала - уточняем, какие именно паттерны совпали
+            for pattern, regex in self.patterns[threat_type]:
+                if regex.search(text):
+                    yield threat_type, pattern
+
+    def scan(self, text: str) -> Dict[str, List[str]]:
+        """Полная проверка текста: {категория: [сработавшие паттерны]}"""
+        result = {}
+        for threat_type, pattern in self.iter_matches(text):
+            result.setdefault(threat_type, []).append(pattern)
+        return result
@@ -0,0 +1,72 @@
+"""
+🌐 ИНДЕКС ПОДСЕТЕЙ (CIDR) ДЛЯ БЛОКИРОВОК
+CyberGuardian - Поиск наиболее специфичного префикса для IPv4 и IPv6
+"""
+
+import ipaddress
+from typing import Iterator, Optional, Union
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class PrefixIndex:
+    """🌐 Longest-prefix match по подсетям IPv4/IPv6"""
+
+    def __init__(self):
+        # Дерево префиксов, сжатое по уровням: на каждую встречающуюся длину
+        # префикса - одна хеш-таблица. Поиск - одно обращение на длину
+        # (на практике единицы), независимо от количества подсетей.
+        # {версия IP: {длина префикса: {старшие биты сети: ключ}}}
+        self._tables = {4: {}, 6: {}}
+        # {версия IP: длины префиксов по убыванию}
+        self._lengths = {4: [], 6: []}
+
+    @staticmethod
+    def _bits(network: IPNetwork) -> int:
+        return int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+
+    def add(self, network: IPNetwork, key: str):
+        """Добавление подсети"""
+        tables = self._tables[network.version]
+        table = tables.get(network.prefixlen)
+        if table is None:
+            table = tables[network.prefixlen] = {}
+            self._lengths[network.version] = sorted(tables, reverse=True)
+        table[self._bits(network)] = key
+
+    def remove(self, network: IPNetwork):
+        """Удаление подсети"""
+        tables = self._tables[network.version]
+        table = tables.get(network.prefixlen)
+        if table is None:
+            return
+        table.pop(self._bits(network), None)
+        if not table:
+            del tables[network.prefixlen]
+            self._lengths[network.version] = sorted(tables, reverse=True)
+
+    def iter_matches(self, address: IPAddress) -> Iterator[str]:
+        """Ключи всех подсетей, содержащих адрес, от самой специфичной"""
+        version = address.version
+        tables = self._tables[version]
+        value = int(address)
+        max_prefixlen = address.max_prefixlen
+        for length in self._lengths[version]:
+            # remove() в другом потоке мог удалить таблицу после чтения списка длин
+            table = tables.get(length)
+            if table is None:
+                continue
+            key = table.get(value >> (max_prefixlen - length))
+            if key is not None:
+                yield key
+
+    def longest_match(self, address: IPAddress) -> Optional[str]:
+        """Ключ наиболее специфичной подсети, содержащей адрес, или None"""
+        return next(self.iter_matches(address), None)
+
+    def __len__(self) -> int:
+        return sum(len(table) for tables in self._tables.values() for table in tables.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._lengths[4] or self._lengths[6])
@@ -0,0 +1,83 @@
+"""
+🔳 РЕНДЕРИНГ QR-КОДОВ
+CyberGuardian - PNG и компактный SVG из матрицы модулей для настройки 2FA
+"""
+
+import base64
+import os
+from io import BytesIO
+from typing import List, Optional
+
+import qrcode
+from PIL import Image
+
+QR_FORMATS = ('png', 'svg')
+
+
+class QRCodeRenderer:
+    """🔳 Матрица строится один раз, PNG - масштабированием 1-битного изображения, SVG - одним path"""
+
+    def __init__(self, box_size: int = None, border: int = 4, mask_pattern: Optional[int] = None):
+        self.box_size = box_size or int(os.getenv('QR_PNG_BOX_SIZE', 6))
+        self.border = border
+        # Фиксированная маска (0-7) пропускает перебор 8 масок со штрафами - в ~4 раза меньше CPU
+        # на построение матрицы; по умолчанию маска выбирается по стандарту
+        if mask_pattern is None and os.getenv('QR_MASK_PATTERN'):
+            mask_pattern = int(os.getenv('QR_MASK_PATTERN'))
+        self.mask_pattern = mask_pattern
+
+    def matrix(self, data: str) -> List[List[bool]]:
+        """Модули QR-кода с рамкой border"""
+        qr = qrcode.QRCode(border=self.border, mask_pattern=self.mask_pattern)
+        qr.add_data(data)
+        qr.make(fit=True)
+        return qr.get_matrix()
+
+    def render_png(self, matrix: List[List[bool]]) -> str:
+        """data URI с PNG: 1 пиксель на модуль, затем увеличение без сглаживания"""
+        size = len(matrix)
+        img = Image.new('1', (size, size), 1)
+        img.putdata([0 if dark else 1 for row in matrix for dark in row])
+        img = img.resize((size * self.box_size, size * self.box_size), Image.NEAREST)
+
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+    def render_svg(self, matrix: List[List[bool]]) -> str:
+        """SVG-разметка: темные модули - горизонтальные отрезки одного path с толщиной линии 1"""
+        size = len(matrix)
+        commands = []
+        for y, row in enumerate(matrix):
+            cursor = None  # x конца предыдущего отрезка в строке (относительные переходы короче)
+            x = 0
+            while x < size:
+                if not row[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                if cursor is None:
+                    commands.append(f"M{start} {y}h{x - start}")
+                else:
+                    commands.append(f"m{start - cursor} 0h{x - start}")
+                cursor = x
+
+        # Линия проходит по середине строки модулей: сдвиг на 0.5 через viewBox
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 -.5 {size} {size}" '
+                f'shape-rendering="crispEdges"><rect y="-.5" width="{size}" height="{size}" fill="#fff"/>'
+                f'<path stroke="#000" d="{"".join(commands)}"/></svg>')
+
+    def render(self, data: str, fmt: str = 'png') -> str:
+        """QR-код в формате png (data URI) или svg (разметка)"""
+        # Без кэша: каждая настройка 2FA создает новый секрет, URI не повторяются
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"Неизвестный формат QR-кода: {fmt}")
+
+        matrix = self.matrix(data)
+        return self.render_png(matrix) if fmt == 'png' else self.render_svg(matrix)
+
+
+# Глобальный рендерер QR-кодов
+qr_renderer = QRCodeRenderer()
@@ -0,0 +1,339 @@
+"""
+🚦 ХРАНИЛИЩА СОСТОЯНИЯ ОГРАНИЧЕНИЯ СКОРОСТИ
+CyberGuardian - Счетчики запросов и блокировки: в памяти процесса или общие для всех воркеров
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from security.event_log import security_events
+
+
+class SlidingWindowCounter:
+    """🪣 Приближенное скользящее окно из фиксированного числа под-корзин"""
+
+    __slots__ = ('width', 'bucket', 'total', 'counts')
+
+    def __init__(self, window_seconds: int, buckets: int):
+        self.width = window_seconds / buckets  # ширина корзины в секундах
+        self.bucket = 0  # номер текущей корзины (время // ширина)
+        self.total = 0  # сумма по всем корзинам окна
+        self.counts = [0] * buckets
+
+    def advance(self, current_time: float):
+        """Сдвиг окна: обнуляем корзины, вышедшие за его пределы"""
+        bucket = int(current_time // self.width)
+        elapsed = bucket - self.bucket
+        if elapsed <= 0:
+            return
+
+        counts = self.counts
+        size = len(counts)
+        if elapsed >= size:
+            counts[:] = [0] * size
+            self.total = 0
+        else:
+            for i in range(self.bucket + 1, bucket + 1):
+                index = i % size
+                self.total -= counts[index]
+                counts[index] = 0
+        self.bucket = bucket
+
+    def add(self):
+        self.counts[self.bucket % len(self.counts)] += 1
+        self.total += 1
+
+    def time_to_reset(self, current_time: float) -> float:
+        """Секунды до истечения самой старой непустой корзины"""
+        size = len(self.counts)
+        for i in range(self.bucket - size + 1, self.bucket + 1):
+            if self.counts[i % size]:
+                return max(0, (i + size) * self.width - current_time)
+        return 0
+
+    def is_idle(self, current_time: float) -> bool:
+        """Все корзины окна истекли"""
+        return int(current_time // self.width) - self.bucket >= len(self.counts)
+
+
+class MemoryRateLimitBackend:
+    """🧠 Состояние в памяти процесса (по умолчанию, у каждого воркера свое)"""
+
+    name = 'memory'
+
+    def __init__(self, buckets: int = 10, sweep_every: int = 1000, max_keys: int = None):
+        # {key: SlidingWindowCounter}, порядок - от давно не использованных к недавним
+        self.counters = OrderedDict()
+        self.blocked = {}  # {key: {blocked_until, reason}}
+        self.buckets = buckets
+        self.sweep_every = sweep_every
+        self.max_keys = max_keys or int(os.getenv('SECURITY_MAX_TRACKED_IPS', 100000))
+        self.evicted_keys = 0  # простаивающие ключи
+        self.evicted_lru = 0  # вытесненные сверх max_keys
+        self._hits_since_sweep = 0
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, window_seconds: int, limit: Optional[int] = None) -> Tuple[bool, int]:
+        """Регистрация запроса: (учтен ли, число в окне); сверх limit запрос не учитывается"""
+        current_time = time.time()
+        with self._lock:
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = self.counters[key] = SlidingWindowCounter(window_seconds, self.buckets)
+                if len(self.counters) > self.max_keys:
+                    self.counters.popitem(last=False)
+                    self.evicted_lru += 1
+            else:
+                self.counters.move_to_end(key)
+            counter.advance(current_time)
+
+            self._hits_since_sweep += 1
+            if self._hits_since_sweep >= self.sweep_every:
+                self._sweep(current_time)
+
+            if limit is not None and counter.total >= limit:
+                return False, counter.total
+
+            counter.add()
+            return True, counter.total
+
+    def get(self, key: str, window_seconds: int) -> Tuple[int, float]:
+        """Число запросов в окне и секунды до сброса"""
+        current_time = time.time()
+        with self._lock:
+            counter = self.counters.get(key)
+            if counter is None:
+                return 0, 0
+            counter.advance(current_time)
+            return counter.total, counter.time_to_reset(current_time)
+
+    def reset(self, key: str):
+        """Сброс счетчика"""
+        with self._lock:
+            self.counters.pop(key, None)
+
+    def _sweep(self, current_time: float):
+        """Удаление простаивающих ключей с начала очереди (вызывается под блокировкой)"""
+        self._hits_since_sweep = 0
+        while self.counters:
+            key, counter = next(iter(self.counters.items()))
+            if not counter.is_idle(current_time):
+                break
+            del self.counters[key]
+            self.evicted_keys += 1
+
+        expired = [key for key, info in self.blocked.items() if info['blocked_until'] <= current_time]
+        for key in expired:
+            del self.blocked[key]
+
+        # Блокировки тоже ограничены: при переполнении снимаются ближайшие к истечению
+        if len(self.blocked) > self.max_keys:
+            overflow = sorted(self.blocked, key=lambda k: self.blocked[k]['blocked_until'])
+            for key in overflow[:len(self.blocked) - self.max_keys]:
+                del self.blocked[key]
+                self.evicted_lru += 1
+
+    def sweep(self):
+        """Принудительная очистка простаивающих ключей и истекших блокировок"""
+        with self._lock:
+            self._sweep(time.time())
+
+    def block(self, key: str, blocked_until: float, reason: str):
+        """Блокировка до blocked_until (epoch)"""
+        with self._lock:
+            self.blocked[key] = {'blocked_until': blocked_until, 'reason': reason}
+
+    def get_block(self, key: str) -> Optional[Dict]:
+        """Действующая блокировка или None (истекшая удаляется)"""
+        # Под блокировкой: _sweep перебирает self.blocked в другом потоке
+        with self._lock:
+            blocked_info = self.blocked.get(key)
+            if blocked_info is None:
+                return None
+            if time.time() < blocked_info['blocked_until']:
+                return blocked_info
+            self.blocked.pop(key, None)
+            return None
+
+    def unblock(self, key: str):
+        """Снятие блокировки"""
+        with self._lock:
+            self.blocked.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        """Размер состояния и счетчики вытеснения"""
+        return {
+            'backend': self.name,
+            'keys': len(self.counters),
+            'blocked': len(self.blocked),
+            'max_keys': self.max_keys,
+            'evicted_idle': self.evicted_keys,
+            'evicted_lru': self.evicted_lru
+        }
+
+
+class SQLiteRateLimitBackend:
+    """🗄️ Общее состояние для всех воркеров хоста в локальной SQLite (WAL)"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str = 'instance/ratelimits.db', idle_seconds: int = 7200, sweep_every: int = 1000):
+        self.db_path = db_path
+        self.idle_seconds = idle_seconds  # строки старше самого длинного окна удаляются
+        self.sweep_every = sweep_every
+        self.evicted_keys = 0
+        self._hits_since_sweep = 0
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение на поток, пересоздается после fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None: транзакциями управляем сами (BEGIN IMMEDIATE)
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        try:
+            self._connection().executescript('''
+                CREATE TABLE IF NOT EXISTS rate_counters (
+                    key TEXT PRIMARY KEY,
+                    window_start REAL NOT NULL,
+                    count INTEGER NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS rate_blocks (
+                    key TEXT PRIMARY KEY,
+                    blocked_until REAL NOT NULL,
+                    reason TEXT
+                );
+            ''')
+        except Exception as e:
+            security_events.emit('rate_limit_db_error', f"❌ Ошибка инициализации БД ограничений скорости: {e}",
+                                 level='error', error=str(e))
+
+    def hit(self, key: str, window_seconds: int, limit: Optional[int] = None) -> Tuple[bool, int]:
+        """Регистрация запроса (фиксированное окно, атомарно для всех воркеров)"""
+        current_time = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_start, count FROM rate_counters WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or current_time - row[0] > window_seconds:
+                window_start, count = current_time, 0
+            else:
+                window_start, count = row
+
+            if limit is not None and count >= limit:
+                conn.execute('COMMIT')
+                return False, count
+
+            count += 1
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_counters (key, window_start, count) VALUES (?, ?, ?)',
+                (key, window_start, count)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._hits_since_sweep += 1
+        if self._hits_since_sweep >= self.sweep_every:
+            self.sweep()
+        return True, count
+
+    def sweep(self):
+        """Удаление давно простаивающих счетчиков и истекших блокировок"""
+        self._hits_since_sweep = 0
+        conn = self._connection()
+        current_time = time.time()
+        cursor = conn.execute('DELETE FROM rate_counters WHERE window_start < ?', (current_time - self.idle_seconds,))
+        self.evicted_keys += cursor.rowcount
+        conn.execute('DELETE FROM rate_blocks WHERE blocked_until <= ?', (current_time,))
+
+    def get(self, key: str, window_seconds: int) -> Tuple[int, float]:
+        """Число запросов в окне и секунды до сброса"""
+        row = self._connection().execute(
+            'SELECT window_start, count FROM rate_counters WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return 0, 0
+
+        time_to_reset = row[0] + window_seconds - time.time()
+        if time_to_reset <= 0:
+            return 0, 0
+        return row[1], time_to_reset
+
+    def reset(self, key: str):
+        """Сброс счетчика"""
+        self._connection().execute('DELETE FROM rate_counters WHERE key = ?', (key,))
+
+    def block(self, key: str, blocked_until: float, reason: str):
+        """Блокировка до blocked_until (epoch)"""
+        self._connection().execute(
+            'INSERT OR REPLACE INTO rate_blocks (key, blocked_until, reason) VALUES (?, ?, ?)',
+            (key, blocked_until, reason)
+        )
+
+    def get_block(self, key: str) -> Optional[Dict]:
+        """Действующая блокировка или None"""
+        row = self._connection().execute(
+            'SELECT blocked_until, reason FROM rate_blocks WHERE key = ? AND blocked_until > ?',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return {'blocked_until': row[0], 'reason': row[1]}
+
+    def unblock(self, key: str):
+        """Снятие блокировки"""
+        self._connection().execute('DELETE FROM rate_blocks WHERE key = ?', (key,))
+
+    def get_stats(self) -> Dict:
+        """Размер состояния и счетчики очистки"""
+        conn = self._connection()
+        return {
+            'backend': self.name,
+            'keys': conn.execute('SELECT COUNT(*) FROM rate_counters').fetchone()[0],
+            'blocked': conn.execute('SELECT COUNT(*) FROM rate_blocks').fetchone()[0],
+            'evicted_idle': self.evicted_keys
+        }
+
+
+RATE_LIMIT_BACKENDS = {
+    'memory': MemoryRateLimitBackend,
+    'sqlite': SQLiteRateLimitBackend,
+}
+
+
+def create_rate_limit_backend(name: str = 'memory', **options):
+    """Создание хранилища по имени из конфигурации (RATE_LIMIT_BACKEND)"""
+    backend_class = RATE_LIMIT_BACKENDS.get(name)
+    if backend_class is None:
+        security_events.emit('rate_limit_backend_unknown', f"⚠️ Неизвестное хранилище лимитов '{name}', используется memory",
+                             level='warning', backend=name)
+        backend_class = MemoryRateLimitBackend
+        options = {}
+    if backend_class is MemoryRateLimitBackend:
+        options = {}
+    return backend_class(**options)
@@ -0,0 +1,95 @@
+"""
+⏱️ ВРЕМЯ СТАДИЙ ПРОВЕРКИ БЕЗОПАСНОСТИ
+CyberGuardian - Гистограммы длительности каждой стадии в формате Prometheus
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+
+# Стадии before_request в порядке выполнения
+SECURITY_STAGES = (
+    'session_fingerprint',
+    'ip_block_check',
+    'rate_limit',
+    'pattern_scan',
+    'suspicious_heuristics',
+    'csrf_check',
+    'input_sanitization',
+)
+
+# Верхние границы корзин в секундах: от 10 мкс (проверка индекса) до секунды (диск, bleach)
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class _Timing:
+    """Контекстный менеджер замера одной стадии"""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics: 'StageMetrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        # Учитываем и стадии, завершившиеся исключением (abort(403) и т.п.)
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class StageMetrics:
+    """⏱️ Гистограммы длительности стадий (у каждого воркера свои)"""
+
+    def __init__(self, stages: Iterable[str] = SECURITY_STAGES, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # {стадия: [счетчики по корзинам + корзина +Inf, сумма секунд, количество]}
+        self._histograms = {stage: [[0] * (len(self.buckets) + 1), 0.0, 0] for stage in stages}
+
+    def observe(self, stage: str, seconds: float):
+        """Регистрация длительности; без блокировки - редкая потеря инкремента между потоками допустима"""
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def time(self, stage: str) -> _Timing:
+        """with stage_metrics.time('pattern_scan'): ..."""
+        return _Timing(self, stage)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Количество, сумма и среднее по стадиям"""
+        return {
+            stage: {
+                'count': count,
+                'sum_seconds': round(total, 6),
+                'avg_ms': round(total / count * 1000, 4) if count else 0.0
+            }
+            for stage, (_, total, count) in self._histograms.items()
+        }
+
+    def render_prometheus(self, name: str = 'cyberguardian_security_stage_seconds') -> str:
+        """Текстовый формат Prometheus (кумулятивные корзины le)"""
+        lines = [
+            f'# HELP {name} Длительность стадий проверки безопасности запроса',
+            f'# TYPE {name} histogram',
+        ]
+        for stage, (counts, total, count) in self._histograms.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.9f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Глобальные гистограммы стадий before_request
+stage_metrics = StageMetrics()
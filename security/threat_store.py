@@ -0,0 +1,305 @@
+"""
+🗄️ ХРАНИЛИЩЕ УГРОЗ
+CyberGuardian - Постоянное соединение с threats.db и фоновая запись журнала
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from security.event_log import security_events
+
+# Отложенная запись (блокировки IP и т.п.) - выполняется писателем в порядке постановки;
+# done (threading.Event) выставляется после успешной записи
+PendingStatement = namedtuple('PendingStatement', 'sql params done', defaults=(None,))
+
+
+class ThreatStore:
+    """🗄️ Доступ к instance/threats.db: одно соединение на воркер и пакетная запись логов"""
+
+    LOG_COLUMNS = (
+        'timestamp', 'ip_address', 'user_agent', 'threat_type', 'threat_details',
+        'request_path', 'request_method', 'severity', 'blocked'
+    )
+
+    def __init__(self, db_path: str = 'instance/threats.db', batch_size: int = None,
+                 flush_interval_ms: int = None, queue_size: int = None, statement_queue_size: int = None):
+        self.db_path = db_path
+        self.batch_size = batch_size or int(os.getenv('THREAT_LOG_BATCH_SIZE', 200))
+        self.flush_interval = (flush_interval_ms or int(os.getenv('THREAT_LOG_FLUSH_MS', 50))) / 1000
+        self.queue_size = queue_size or int(os.getenv('THREAT_LOG_QUEUE_SIZE', 10000))
+        # Отдельный лимит для отложенных записей (блокировки IP): они не вытесняют строки журнала и наоборот
+        self.statement_queue_size = statement_queue_size or int(os.getenv('THREAT_STORE_STATEMENT_QUEUE_SIZE', 10000))
+
+        self._lock = threading.Lock()
+        # Число строк журнала и отложенных записей в очереди (qsize считает их вместе)
+        self._pending_lock = threading.Lock()
+        self._pending_rows = 0
+        self._pending_statements = 0
+        self._conn = None
+        self._pid = None
+        self._queue = None
+        self._writer = None
+
+        # Метрики фоновой записи
+        self.metrics = {
+            'queued_rows': 0,
+            'written_rows': 0,
+            'dropped_rows': 0,
+            'queued_statements': 0,
+            'written_statements': 0,
+            'dropped_statements': 0,
+            'batches': 0,
+            'write_errors': 0
+        }
+
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Новое соединение в режиме WAL"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def _ensure_process(self):
+        """Пересоздание соединения и писателя после fork (воркеры gunicorn)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Соединение родителя нельзя использовать в дочернем процессе
+            self._conn = self._connect()
+            # Общая очередь ограничена суммой лимитов, каждый вид записей считается отдельно
+            self._queue = queue.Queue(maxsize=self.queue_size + self.statement_queue_size)
+            self._pending_rows = 0
+            self._pending_statements = 0
+            self._writer = threading.Thread(target=self._writer_loop, name='threat-log-writer', daemon=True)
+            self._pid = pid
+            self._writer.start()
+
+    # ------------------------------------------------------------------
+    # Чтение и синхронная запись через постоянное соединение
+    # ------------------------------------------------------------------
+
+    def execute(self, sql: str, params: Tuple = ()) -> int:
+        """Синхронная запись, возвращает число строк"""
+        self._ensure_process()
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def executescript(self, script: str):
+        """Выполнение DDL-скрипта"""
+        self._ensure_process()
+        with self._lock:
+            self._conn.executescript(script)
+            self._conn.commit()
+
+    def fetchone(self, sql: str, params: Tuple = ()) -> Optional[tuple]:
+        """Чтение одной строки"""
+        self._ensure_process()
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        """Чтение всех строк"""
+        self._ensure_process()
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def backfill_rollups(self):
+        """Однократное заполнение агрегатов из security_logs за последние сутки"""
+        self._ensure_process()
+        with self._lock:
+            conn = self._conn
+            # BEGIN IMMEDIATE: заполнение выполнит только один воркер
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute("INSERT OR IGNORE INTO security_rollup_meta (name) VALUES ('backfill')")
+                if cursor.rowcount:
+                    for table, column in (('security_rollup_threat_minute', 'threat_type'),
+                                          ('security_rollup_ip_minute', 'ip_address')):
+                        conn.execute(f'''
+                            INSERT INTO {table} (minute, {column}, count)
+                            SELECT substr(timestamp, 1, 16), {column}, COUNT(*)
+                            FROM security_logs
+                            WHERE timestamp > datetime('now', '-24 hours') AND {column} IS NOT NULL
+                            GROUP BY 1, 2
+                            ON CONFLICT (minute, {column}) DO UPDATE SET count = count + excluded.count
+                        ''')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    # ------------------------------------------------------------------
+    # Фоновая пакетная запись security_logs
+    # ------------------------------------------------------------------
+
+    def enqueue_log(self, ip: str, user_agent: str, threat_type: str, details: str,
+                    path: str, method: str, severity: str, blocked: bool) -> bool:
+        """Постановка записи журнала в очередь (не блокирует поток запроса)"""
+        self._ensure_process()
+        # Время фиксируем сейчас, а не в момент вставки пакета (формат CURRENT_TIMESTAMP)
+        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        row = (timestamp, ip, user_agent, threat_type, details, path, method, severity, blocked)
+
+        with self._pending_lock:
+            if self._pending_rows >= self.queue_size:
+                # Очередь переполнена - отбрасываем запись, но считаем потери
+                self.metrics['dropped_rows'] += 1
+                return False
+            self._pending_rows += 1
+
+        self._queue.put_nowait(row)
+        self.metrics['queued_rows'] += 1
+        return True
+
+    def enqueue_execute(self, sql: str, params: Tuple = (), done: threading.Event = None) -> bool:
+        """Отложенная запись через фоновый писатель (порядок между вызовами сохраняется)"""
+        self._ensure_process()
+        with self._pending_lock:
+            if self._pending_statements >= self.statement_queue_size:
+                # Блокировка остается в индексе памяти этого воркера, но в БД не попадет
+                self.metrics['dropped_statements'] += 1
+                security_events.emit('threat_store_overflow', "⚠️ Очередь отложенных записей БД угроз переполнена",
+                                     level='warning', sample_key=(), capacity=self.statement_queue_size)
+                return False
+            self._pending_statements += 1
+
+        self._queue.put_nowait(PendingStatement(sql, params, done))
+        self.metrics['queued_statements'] += 1
+        return True
+
+    def _writer_loop(self):
+        """Цикл писателя: пакет из batch_size строк или по истечении flush_interval"""
+        conn = self._connect()
+        sql = (f"INSERT INTO security_logs ({', '.join(self.LOG_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(self.LOG_COLUMNS))})")
+        log_queue = self._queue
+
+        while True:
+            batch = []
+            stop = False
+
+            item = log_queue.get()
+            if item is None:
+                stop = True
+            else:
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = log_queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+
+            if batch:
+                self._write_batch(conn, sql, batch)
+                statements = sum(isinstance(item, PendingStatement) for item in batch)
+                with self._pending_lock:
+                    self._pending_rows -= len(batch) - statements
+                    self._pending_statements -= statements
+            for _ in range(len(batch) + (1 if stop else 0)):
+                log_queue.task_done()
+
+            if stop:
+                conn.close()
+                return
+
+    def _write_batch(self, conn: sqlite3.Connection, sql: str, batch: List[tuple]):
+        """Запись пакета: строки журнала с агрегатами, затем отложенные записи"""
+        statements = [item for item in batch if isinstance(item, PendingStatement)]
+        if statements:
+            batch = [item for item in batch if not isinstance(item, PendingStatement)]
+            try:
+                with conn:
+                    for statement in statements:
+                        conn.execute(statement.sql, statement.params)
+                self.metrics['written_statements'] += len(statements)
+                for statement in statements:
+                    if statement.done is not None:
+                        statement.done.set()
+            except Exception as e:
+                self.metrics['write_errors'] += 1
+                security_events.emit('threat_store_error', f"❌ Ошибка отложенной записи в БД угроз: {e}",
+                                     level='error', error=str(e))
+        if not batch:
+            return
+
+        # Поля строки: timestamp[0], ip_address[1], threat_type[3]
+        by_threat = Counter((row[0][:16], row[3]) for row in batch)
+        by_ip = Counter((row[0][:16], row[1]) for row in batch)
+        try:
+            with conn:
+                conn.executemany(sql, batch)
+                conn.executemany('''
+                    INSERT INTO security_rollup_threat_minute (minute, threat_type, count) VALUES (?, ?, ?)
+                    ON CONFLICT (minute, threat_type) DO UPDATE SET count = count + excluded.count
+                ''', [(minute, threat_type, count) for (minute, threat_type), count in by_threat.items()])
+                conn.executemany('''
+                    INSERT INTO security_rollup_ip_minute (minute, ip_address, count) VALUES (?, ?, ?)
+                    ON CONFLICT (minute, ip_address) DO UPDATE SET count = count + excluded.count
+                ''', [(minute, ip, count) for (minute, ip), count in by_ip.items()])
+            self.metrics['written_rows'] += len(batch)
+            self.metrics['batches'] += 1
+        except Exception as e:
+            self.metrics['write_errors'] += 1
+            security_events.emit('threat_store_error', f"❌ Ошибка пакетной записи журнала угроз: {e}",
+                                 level='error', rows=len(batch), error=str(e))
+
+    def flush(self):
+        """Ожидание записи всех поставленных в очередь строк"""
+        if self._pid == os.getpid() and self._writer and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Сброс очереди и закрытие соединений (вызывается при завершении процесса)"""
+        if self._pid != os.getpid():
+            return
+
+        if self._writer and self._writer.is_alive():
+            # Блокирующий put: маркер остановки должен попасть в очередь после данных
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._pid = None
+
+    def get_metrics(self) -> Dict:
+        """Метрики фоновой записи"""
+        return {
+            **self.metrics,
+            'pending_rows': self._pending_rows,
+            'pending_statements': self._pending_statements,
+            'queue_capacity': self.queue_size,
+            'statement_queue_capacity': self.statement_queue_size,
+            'batch_size': self.batch_size,
+            'flush_interval_ms': int(self.flush_interval * 1000)
+        }
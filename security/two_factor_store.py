@@ -0,0 +1,193 @@
+"""
+🔐 ХРАНИЛИЩЕ ДВУХФАКТОРНОЙ АУТЕНТИФИКАЦИИ
+CyberGuardian - Секреты TOTP в зашифрованном виде и хеши резервных кодов (werkzeug) в локальной SQLite
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from security.bounded_store import BoundedStore
+from security.data_protection import data_encryption
+from security.event_log import security_events
+
+
+class TwoFactorStore:
+    """🗄️ Общие для всех воркеров данные 2FA (WAL) с кэшем расшифрованных секретов"""
+
+    def __init__(self, db_path: str = 'instance/two_factor.db', encryption=None,
+                 cache_size: int = None, cache_ttl: float = None):
+        self.db_path = db_path
+        # Без постоянных ENCRYPTION_MASTER_KEY / ENCRYPTION_SALT ключ у каждого процесса свой (см. create_app)
+        self.encryption = encryption or data_encryption
+        # Кэш только включенных 2FA: отключение на другом воркере видно через cache_ttl секунд,
+        # а до тех пор код все равно запрашивается (ошибка в безопасную сторону)
+        self.cache = BoundedStore(
+            max_keys=cache_size or int(os.getenv('SECURITY_2FA_CACHE_SIZE', 1024)),
+            ttl_seconds=cache_ttl if cache_ttl is not None else float(os.getenv('SECURITY_2FA_CACHE_TTL', 30))
+        )
+        # Метод werkzeug для хешей резервных кодов: проверка сравнивает код со всеми (до 8) хешами,
+        # поэтому итераций меньше, чем у паролей (~50 мс на хеш вместо ~350 мс)
+        self.backup_code_hash_method = os.getenv('SECURITY_BACKUP_CODE_HASH_METHOD', 'pbkdf2:sha256:100000')
+        self.stats = {'cache_hits': 0, 'cache_misses': 0, 'decrypt_errors': 0, 'backup_codes_used': 0}
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение на поток, пересоздается после fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        try:
+            self._connection().executescript('''
+                CREATE TABLE IF NOT EXISTS two_factor_secrets (
+                    user_id TEXT PRIMARY KEY,
+                    secret_encrypted TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS two_factor_backup_codes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    salt TEXT NOT NULL,  -- не используется: соль хранится в code_hash (werkzeug)
+                    code_hash TEXT NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_two_factor_backup_codes_user
+                    ON two_factor_backup_codes(user_id);
+            ''')
+        except Exception as e:
+            security_events.emit('two_factor_db_error', f"❌ Ошибка инициализации БД 2FA: {e}",
+                                 level='error', error=str(e))
+
+    def save(self, user_id, secret_key: str, backup_codes: List[str]):
+        """Включение 2FA: секрет шифруется, резервные коды хешируются; старые данные заменяются"""
+        encrypted = self.encryption.encrypt_data(secret_key)
+        if encrypted is None:
+            raise ValueError('Не удалось зашифровать секрет 2FA')
+
+        # Медленный хеш с солью внутри (колонка salt не используется): 8 цифр за один SHA-256
+        # перебираются за секунды
+        rows = [(str(user_id), '', generate_password_hash(code, self.backup_code_hash_method))
+                for code in backup_codes]
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO two_factor_secrets (user_id, secret_encrypted, created_at) VALUES (?, ?, ?)',
+                (str(user_id), encrypted, time.time())
+            )
+            conn.execute('DELETE FROM two_factor_backup_codes WHERE user_id = ?', (str(user_id),))
+            conn.executemany(
+                'INSERT INTO two_factor_backup_codes (user_id, salt, code_hash) VALUES (?, ?, ?)', rows
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.cache[str(user_id)] = secret_key
+
+    def delete(self, user_id):
+        """Отключение 2FA"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM two_factor_secrets WHERE user_id = ?', (str(user_id),))
+            conn.execute('DELETE FROM two_factor_backup_codes WHERE user_id = ?', (str(user_id),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.cache.pop(str(user_id))
+
+    def is_enabled(self, user_id) -> bool:
+        """Есть ли запись 2FA (даже если секрет не расшифровывается - тогда вход по коду невозможен)"""
+        if str(user_id) in self.cache:
+            self.stats['cache_hits'] += 1
+            return True
+        row = self._connection().execute(
+            'SELECT 1 FROM two_factor_secrets WHERE user_id = ?', (str(user_id),)
+        ).fetchone()
+        return row is not None
+
+    def get_secret(self, user_id) -> Optional[str]:
+        """Расшифрованный секрет TOTP (через кэш) или None"""
+        key = str(user_id)
+        try:
+            secret_key = self.cache[key]
+            self.stats['cache_hits'] += 1
+            return secret_key
+        except KeyError:
+            self.stats['cache_misses'] += 1
+
+        row = self._connection().execute(
+            'SELECT secret_encrypted FROM two_factor_secrets WHERE user_id = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        secret_key = self.encryption.decrypt_data(row[0])
+        if secret_key is None:
+            # Сменился ENCRYPTION_MASTER_KEY / ENCRYPTION_SALT: 2FA остается включенной, но код не пройдет
+            self.stats['decrypt_errors'] += 1
+            security_events.emit('two_factor_decrypt_error', "❌ Не удалось расшифровать секрет 2FA",
+                                 level='error', sample_key=(), user_id=key)
+            return None
+
+        self.cache[key] = secret_key
+        return secret_key
+
+    def consume_backup_code(self, user_id, code: str) -> bool:
+        """Проверка резервного кода и его удаление; время проверки не зависит от того, какой код совпал"""
+        key = str(user_id)
+        rows = self._connection().execute(
+            'SELECT id, code_hash FROM two_factor_backup_codes WHERE user_id = ?', (key,)
+        ).fetchall()
+
+        # Сравниваем со всеми кодами без раннего выхода
+        matched_id = None
+        for code_id, code_hash in rows:
+            if check_password_hash(code_hash, code):
+                matched_id = code_id
+        if matched_id is None:
+            return False
+
+        # Удаление атомарно: одновременное использование кода на двух воркерах пройдет только один раз
+        cursor = self._connection().execute(
+            'DELETE FROM two_factor_backup_codes WHERE id = ?', (matched_id,)
+        )
+        if cursor.rowcount != 1:
+            return False
+        self.stats['backup_codes_used'] += 1
+        return True
+
+    def remaining_backup_codes(self, user_id) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM two_factor_backup_codes WHERE user_id = ?', (str(user_id),)
+        ).fetchone()[0]
+
+    def get_stats(self) -> Dict:
+        return {
+            'users': self._connection().execute('SELECT COUNT(*) FROM two_factor_secrets').fetchone()[0],
+            'cache': self.cache.get_stats(),
+            **self.stats
+        }
@@ -7,11 +7,17 @@ import re
 import html
 import bleach
 from typing import List, Dict, Optional, Union
-from flask import request, g, session, abort, jsonify, make_response
+from flask import request, g, session, abort, jsonify, make_response, current_app, has_app_context, has_request_context
 from markupsafe import Markup, escape
-from datetime import datetime, timedelta
 import hashlib
-import secrets
+import hmac
+import base64
+import time
+
+from security.literal_prefilter import LiteralPrefilter, fold_case
+from security.stage_metrics import stage_metrics
+from security.event_log import security_events
+from security.auth_security import session_security
 
 class XSSProtection:
     """🔒 Защита от XSS (Cross-Site Scripting) атак"""
@@ -61,6 +67,19 @@ class XSSProtection:
             r'axios\.',
             r'fetch\('
         ]
+        self.compile_malicious_patterns()
+    
+    def compile_malicious_patterns(self):
+        """Компиляция запрещенных паттернов и предфильтра по их литералам"""
+        self._malicious_regexes = [re.compile(pattern, re.IGNORECASE) for pattern in self.malicious_patterns]
+        self._malicious_prefilter = LiteralPrefilter(
+            (index, pattern, re.IGNORECASE) for index, pattern in enumerate(self.malicious_patterns)
+        )
+    
+    def has_malicious_pattern(self, text: str) -> bool:
+        """Есть ли в тексте запрещенный паттерн (регулярки - только с найденными литералами)"""
+        candidates = self._malicious_prefilter.candidates(fold_case(text))
+        return any(self._malicious_regexes[index].search(text) for index in sorted(candidates))
     
     def sanitize_html(self, text: str, allowed_tags: Optional[set] = None, allowed_attrs: Optional[dict] = None) -> str:
         """Санитация HTML контента"""
@@ -77,10 +96,9 @@ class XSSProtection:
         )
         
         # Дополнительная проверка на вредоносные паттерны
-        for pattern in self.malicious_patterns:
-            if re.search(pattern, clean_text, re.IGNORECASE):
-                # Если найден вредоносный паттерн, полностью очищаем HTML
-                return html.escape(text)
+        if self.has_malicious_pattern(clean_text):
+            # Если найден вредоносный паттерн, полностью очищаем HTML
+            return html.escape(text)
         
         return clean_text
     
@@ -125,58 +143,85 @@ class CSRFProtection:
     """🛡️ Защита от CSRF (Cross-Site Request Forgery) атак"""
     
     def __init__(self, secret_key: str = None):
+        # Вне контекста приложения; в запросе ключ берется из app.config['SECRET_KEY']
         self.secret_key = secret_key or "cyberguardian-csrf-secret-2024"
-        self.token_timeout = 3600  # 1 час
-        
-    def generate_csrf_token(self) -> str:
-        """Генерация CSRF токена"""
-        timestamp = str(datetime.now().timestamp())
-        token_data = f"{session.get('session_id', '')}{timestamp}{self.secret_key}"
-        token = hashlib.sha256(token_data.encode()).hexdigest()
-        return token
+        self.token_timeout = 3600  # 1 час (переопределяется WTF_CSRF_TIME_LIMIT)
+        self._key_source = None
+        self._mac = None
+        
+    def get_mac(self):
+        """HMAC с ключом, производным от SECRET_KEY; пересоздается только при смене секрета"""
+        secret = current_app.config.get('SECRET_KEY') if has_app_context() else None
+        secret = secret or self.secret_key
+        if secret != self._key_source:
+            source = secret.encode() if isinstance(secret, str) else secret
+            signing_key = hmac.new(source, b'cyberguardian-csrf', hashlib.sha256).digest()
+            self._mac = hmac.new(signing_key, digestmod=hashlib.sha256)
+            self._key_source = secret
+        return self._mac
     
-    def get_csrf_token(self) -> str:
-        """Получение CSRF токена из сессии"""
-        if 'csrf_token' not in session or self.is_token_expired():
-            session['csrf_token'] = self.generate_csrf_token()
-            session['csrf_token_time'] = datetime.now().isoformat()
-        return session['csrf_token']
+    def sign(self, session_id: str, expires: int, scope: str = None) -> str:
+        """Подпись: HMAC-SHA256 над ID сессии, сроком действия и областью формы"""
+        # Копия готового HMAC дешевле, чем повторная подготовка ключа на каждый токен
+        mac = self.get_mac().copy()
+        mac.update(f"{session_id}|{expires}|{scope or ''}".encode())
+        return base64.urlsafe_b64encode(mac.digest()).rstrip(b'=').decode()
+        
+    def generate_csrf_token(self, scope: str = None) -> str:
+        """Генерация CSRF токена вида '<срок в hex>.<подпись>'"""
+        timeout = current_app.config.get('WTF_CSRF_TIME_LIMIT') if has_app_context() else None
+        expires = int(time.time()) + (timeout or self.token_timeout)
+        return f"{expires:x}.{self.sign(session.get('session_id', ''), expires, scope)}"
     
-    def is_token_expired(self) -> bool:
-        """Проверка истечения токена"""
-        if 'csrf_token_time' not in session:
-            return True
-        
+    def get_csrf_token(self, scope: str = None) -> str:
+        """CSRF токен без хранения в сессии; scope - имя endpoint'а, для которого он действителен"""
+        # Токен привязан к ID сессии: в ленивом режиме сессия появляется вместе с первой формой
+        session_security.ensure_session(request)
+        
+        # Один токен на область в пределах запроса
+        tokens = g.setdefault('csrf_tokens', {})
+        if scope not in tokens:
+            tokens[scope] = self.generate_csrf_token(scope)
+        return tokens[scope]
+    
+    def is_token_expired(self, token: str) -> bool:
+        """Проверка истечения токена (срок записан в самом токене)"""
         try:
-            token_time = datetime.fromisoformat(session['csrf_token_time'])
-            return (datetime.now() - token_time).seconds > self.token_timeout
-        except:
+            return int(token.partition('.')[0], 16) <= time.time()
+        except (AttributeError, ValueError):
             return True
     
-    def validate_csrf_token(self, token: str) -> bool:
-        """Валидация CSRF токена"""
-        session_token = session.get('csrf_token')
-        if not session_token or not token:
+    def validate_csrf_token(self, token: str, scope: str = None) -> bool:
+        """Валидация CSRF токена: только вычисление HMAC, сессия не меняется"""
+        session_id = session.get('session_id')
+        if not session_id or not token or not isinstance(token, str):
             return False
         
-        # Проверяем соответствие токенов
-        if secrets.compare_digest(session_token, token):
-            return True
+        expires_hex, _, signature = token.partition('.')
+        try:
+            expires = int(expires_hex, 16)
+        except ValueError:
+            return False
+        if expires <= time.time():
+            return False
         
-        return False
+        # Проверяем соответствие подписи
+        return hmac.compare_digest(self.sign(session_id, expires, scope), signature)
     
     def csrf_protect(self):
         """CSRF защита для POST/PUT/DELETE запросов"""
         if request.method in ['POST', 'PUT', 'DELETE', 'PATCH']:
-            # Проверяем CSRF токен
-            token = request.form.get('csrf_token') or request.headers.get('X-CSRF-Token')
+            # Проверяем CSRF токен: общий или выпущенный для этого endpoint'а
+            token = (request.form.get('csrf_token') or request.headers.get('X-CSRF-Token')
+                     or request.headers.get('X-CSRFToken'))
             
-            if not token or not self.validate_csrf_token(token):
+            if not token or not (self.validate_csrf_token(token)
+                                 or self.validate_csrf_token(token, request.endpoint)):
                 abort(403, description='CSRF токен недействителен')
     
-    def get_csrf_form_field(self) -> str:
+    def get_csrf_form_field(self, scope: str = None) -> str:
         """Получение HTML поля для CSRF токена"""
-        token = self.get_csrf_token()
+        token = self.get_csrf_token(scope)
         return f'<input type="hidden" name="csrf_token" value="{token}">'
 
 class SecurityHeaders:
@@ -342,44 +387,104 @@ input_validator = InputValidator()
 def security_validation_middleware():
     """Middleware для валидации и защиты"""
     try:
-        # CSRF защита
-        csrf_protection.csrf_protect()
-        
-        # Валидация входных данных
+        # Валидация входных данных до CSRF: g.sanitized_inputs заполняется при любом исходе проверки токена
         if request.method in ['POST', 'PUT', 'PATCH']:
-            validate_request_data()
+            with stage_metrics.time('input_sanitization'):
+                validate_request_data()
+        
+        # CSRF защита
+        with stage_metrics.time('csrf_check'):
+            csrf_protection.csrf_protect()
         
         # Добавляем информацию о проверке в g
         g.security_validated = True
         
     except Exception as e:
-        print(f"❌ Ошибка в security validation: {e}")
+        security_events.emit('validation_error', f"❌ Ошибка в security validation: {e}", level='warning',
+                             sample_key=(request.path, type(e).__name__), path=request.path, error=str(e))
+
+# 🧹 ПОЛИТИКИ ПОЛЕЙ: 'html' - XSSProtection.sanitize_input (по умолчанию), 'text' - только
+# экранирование HTML, 'skip' - поле не санитизируется (пароли для проверки надежности, шифртекст)
+INPUT_POLICIES = ('html', 'text', 'skip')
+
+def input_policy(**fields):
+    """Декоратор маршрута: политики полей, например @input_policy(password='skip')"""
+    for field, policy in fields.items():
+        if policy not in INPUT_POLICIES:
+            raise ValueError(f"Неизвестная политика поля {field}: {policy}")
+    
+    def decorator(f):
+        f.input_policies = {**getattr(f, 'input_policies', {}), **fields}
+        return f
+    return decorator
+
+# Политика необъявленных полей по blueprint'ам, например 'text' там, где обработчики берут
+# значения через SecurityUtils.sanitize_input: middleware и обработчик используют одну запись кэша
+BLUEPRINT_INPUT_POLICIES = {}
+
+def blueprint_input_policy(blueprint: str, policy: str):
+    """Политика по умолчанию для полей маршрутов blueprint'а (вместо 'html')"""
+    if policy not in INPUT_POLICIES:
+        raise ValueError(f"Неизвестная политика полей {blueprint}: {policy}")
+    BLUEPRINT_INPUT_POLICIES[blueprint] = policy
+
+def get_input_policies() -> Dict[str, str]:
+    """Политики полей текущего маршрута"""
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'input_policies', {})
+
+def escape_text(text: str) -> str:
+    """Экранирование HTML без удаления символов"""
+    if not text:
+        return ""
+    return html.escape(text).strip()
+
+def sanitized_input(value: str, policy: str = 'html', max_length: int = 1000) -> str:
+    """Санитизированное значение из кэша запроса (g): каждое значение обрабатывается один раз"""
+    if policy == 'skip':
+        return value
+    if not has_request_context():
+        return escape_text(value) if policy == 'text' else xss_protection.sanitize_input(value, max_length)
+    
+    cache = g.setdefault('sanitized_inputs', {})
+    key = (policy, max_length if policy == 'html' else None, value)
+    result = cache.get(key)
+    if result is None:
+        result = escape_text(value) if policy == 'text' else xss_protection.sanitize_input(value, max_length)
+        cache[key] = result
+    return result
 
 def validate_request_data():
-    """Валидация данных запроса"""
-    # Валидация JSON данных
+    """Валидация данных запроса; результаты санитизации остаются в g для обработчиков"""
+    policies = get_input_policies()
+    default_policy = BLUEPRINT_INPUT_POLICIES.get(request.blueprint, 'html')
+    sources = []
+    
+    # JSON данные
     if request.is_json:
-        data = request.get_json()
-        if data:
-            for key, value in data.items():
-                if isinstance(value, str):
-                    # Санитация строковых данных
-                    sanitized = xss_protection.sanitize_input(value)
-                    if sanitized != value:
-                        print(f"⚠️ Санитизированы данные в поле {key}")
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            sources.append(('json', 'данные', data))
     
-    # Валидация form данных
+    # Form данные
     if request.form:
-        for key, value in request.form.items():
-            if isinstance(value, str):
-                # Санитация form данных
-                sanitized = xss_protection.sanitize_input(value)
-                if sanitized != value:
-                    print(f"⚠️ Санитизированы form данные в поле {key}")
+        sources.append(('form', 'form данные', request.form))
+    
+    for source, label, fields in sources:
+        for key, value in fields.items():
+            policy = policies.get(key, default_policy)
+            if policy == 'skip' or not isinstance(value, str):
+                continue
+            
+            # Санитация строковых данных
+            sanitized = sanitized_input(value, policy)
+            if sanitized != value:
+                security_events.emit('input_sanitized', f"⚠️ Санитизированы {label} в поле {key}",
+                                     sample_key=(request.path, key), path=request.path, field=key, source=source)
 
-def get_security_form_field():
+def get_security_form_field(scope: str = None):
     """Получение поля CSRF токена для форм"""
-    return csrf_protection.get_csrf_form_field()
+    return csrf_protection.get_csrf_form_field(scope)
 
 def safe_render_template(template_name, **context):
     """Безопасный рендеринг шаблона с автоматической санитацией"""
@@ -389,7 +494,7 @@ def safe_render_template(template_name, **context):
     safe_context = {}
     for key, value in context.items():
         if isinstance(value, str):
-            safe_context[key] = xss_protection.sanitize_input(value)
+            safe_context[key] = sanitized_input(value)
         else:
             safe_context[key] = value
     
@@ -10,6 +10,7 @@ from urllib.parse import urlparse
 import subprocess
 import platform
 import datetime
+from security.web_protection import input_policy
 
 scanner_bp = Blueprint('scanner', __name__)
 
@@ -478,6 +479,7 @@ def vulnerability_scanner():
 
 # API endpoints
 @scanner_bp.route('/api/scan/password', methods=['POST'])
+@input_policy(password='skip')
 def scan_password():
     data = request.get_json()
     password = data.get('password', '')
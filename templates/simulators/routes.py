@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 import random
 import time
 from datetime import datetime
+from security.web_protection import input_policy
 
 simulators_bp = Blueprint('simulators', __name__)
 
@@ -233,6 +234,7 @@ def check_social():
     })
 
 @simulators_bp.route('/api/crack-password', methods=['POST'])
+@input_policy(password='skip')
 @login_required
 def crack_password():
     """Симуляция взлома пароля"""
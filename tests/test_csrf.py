@@ -0,0 +1,117 @@
+"""
+🛡️ ТЕСТЫ CSRF ТОКЕНОВ
+Подписанные HMAC токены CSRFProtection: срок действия, область формы, привязка к сессии
+"""
+
+import os
+import time
+
+import pytest
+from flask import Flask, session
+
+
+@pytest.fixture(scope='module')
+def csrf_module(tmp_path_factory):
+    """security.web_protection, импортированный во временном каталоге (instance/ репозитория не меняется)"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('csrf'))
+    try:
+        from security import web_protection
+        yield web_protection
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test-secret-key'
+    return app
+
+
+@pytest.fixture
+def csrf(csrf_module):
+    return csrf_module.CSRFProtection()
+
+
+def request_context(app, session_id='session-a'):
+    """Контекст POST-запроса с заданным ID сессии"""
+    context = app.test_request_context('/form', method='POST')
+    context.push()
+    session['session_id'] = session_id
+    return context
+
+
+def signed_token(csrf, expires, scope=None):
+    """Токен с произвольным сроком и настоящей подписью для текущей сессии"""
+    return f"{expires:x}.{csrf.sign(session['session_id'], expires, scope)}"
+
+
+def test_valid_token_is_accepted(app, csrf):
+    context = request_context(app)
+    try:
+        token = csrf.generate_csrf_token()
+        assert csrf.validate_csrf_token(token)
+        assert not csrf.is_token_expired(token)
+    finally:
+        context.pop()
+
+
+def test_expired_token_is_rejected(app, csrf):
+    context = request_context(app)
+    try:
+        token = signed_token(csrf, int(time.time()) - 1)
+        assert csrf.is_token_expired(token)
+        assert not csrf.validate_csrf_token(token)
+    finally:
+        context.pop()
+
+
+def test_scoped_and_unscoped_tokens(app, csrf):
+    context = request_context(app)
+    try:
+        unscoped = csrf.generate_csrf_token()
+        scoped = csrf.generate_csrf_token('admin.delete_story_api')
+
+        assert csrf.validate_csrf_token(scoped, 'admin.delete_story_api')
+        assert not csrf.validate_csrf_token(scoped)
+        assert not csrf.validate_csrf_token(scoped, 'admin.delete_user_api')
+
+        assert csrf.validate_csrf_token(unscoped)
+        assert not csrf.validate_csrf_token(unscoped, 'admin.delete_story_api')
+    finally:
+        context.pop()
+
+
+def test_tampered_expiry_is_rejected(app, csrf):
+    context = request_context(app)
+    try:
+        token = csrf.generate_csrf_token()
+        expires_hex, _, signature = token.partition('.')
+        tampered = f"{int(expires_hex, 16) + 86400:x}.{signature}"
+        assert not csrf.validate_csrf_token(tampered)
+    finally:
+        context.pop()
+
+
+def test_token_from_other_session_is_rejected(app, csrf):
+    context = request_context(app, 'session-a')
+    try:
+        token = csrf.generate_csrf_token()
+    finally:
+        context.pop()
+
+    context = request_context(app, 'session-b')
+    try:
+        assert not csrf.validate_csrf_token(token)
+    finally:
+        context.pop()
+
+
+@pytest.mark.parametrize('token', [None, 12345, b'abc.def', ['abc.def'], {'csrf_token': 'abc.def'}])
+def test_non_string_token_is_rejected(app, csrf, token):
+    context = request_context(app)
+    try:
+        assert not csrf.validate_csrf_token(token)
+    finally:
+        context.pop()